@@ -1,10 +1,7 @@
-import asnake.logging as logging
-from asnake.client import ASnakeClient
-
-logging.setup_logging(filename="/logs/aspace-flask.log", filemode="a", level="INFO")
-client = ASnakeClient()
+from utilities.aspace_client import get_client
 
 def add_aspace_items(refID, title_1, display_date_1, normal_date_1, title_2, display_date_2, normal_date_2):
+    client = get_client()
 
     ref = client.get("repositories/2/find_by_id/archival_objects?ref_id[]=" + refID).json()
     item = client.get(ref["archival_objects"][0]["ref"]).json()
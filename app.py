@@ -3,8 +3,10 @@ import shlex
 from flask import Flask
 from flask import flash, redirect, Markup
 from flask import request
-from flask import url_for, send_from_directory
+from flask import url_for, send_from_directory, abort
 from markupsafe import escape
+from werkzeug.utils import safe_join
+from werkzeug.exceptions import HTTPException
 from flask import render_template
 
 from forms.ingest import IngestForm
@@ -26,11 +28,13 @@ from add_items import add_aspace_items
 from hyrax import addAccession
 
 import csv
+import math
 import shutil
 from datetime import datetime
 from dotenv import load_dotenv
-from subprocess import Popen, PIPE
-import traceback
+from jobs import enqueue, get_job
+from log_files import LOG_DIR, read_tail, log_error, read_errors
+import log_index
 
 app = Flask(__name__)
 load_dotenv()
@@ -54,13 +58,11 @@ def ingest():
             log_file = f"/logs/{datetime.now().strftime('%Y-%m-%dT%H.%M.%S.%f')}-ingest-{collectionID}.log"
             command = [
                 "python", "-u", "/code/utilities/ingest.py", 
-                shlex.quote(collectionID)
+                collectionID
             ]
-            safe_command = " ".join(command) + f" >> {shlex.quote(log_file)} 2>&1 &"
-            #print ("running command: " + safe_command)
-            ingest = Popen(safe_command, shell=True, stdout=PIPE, stderr=PIPE)
+            job_id = enqueue("ingest", command, log_file)
 
-            success_msg = Markup(f'<div>Success! Checkout the log at <a href="{log_file}">{log_file}</a></div>')
+            success_msg = Markup(f'<div>Success! Queued as job {job_id}. Checkout the log at <a href="{log_file}">{log_file}</a></div>')
             flash(success_msg, 'success')
             return redirect(url_for('ingest'))
     return render_template('ingest.html', error=error)
@@ -80,14 +82,12 @@ def accession():
             log_file = f"/logs/{datetime.now().strftime('%Y-%m-%dT%H.%M.%S.%f')}-accession-{collectionID}.log"
             command = [
                 "python", "/code/utilities/ingest.py", 
-                shlex.quote(collectionID), 
-                "-a", shlex.quote(accessionID)
+                collectionID, 
+                "-a", accessionID
             ]
-            safe_command = " ".join(command) + f" >> {shlex.quote(log_file)} 2>&1 &"
-            #print ("running command: " + safe_command)
-            accession = Popen(safe_command, shell=True, stdout=PIPE, stderr=PIPE)
+            job_id = enqueue("accession", command, log_file)
 
-            success_msg = Markup(f'<div>Success! Packaging accession {accessionID}. Checkout the log at <a href="{log_file}">{log_file}</a></div>')
+            success_msg = Markup(f'<div>Success! Packaging accession {accessionID} as job {job_id}. Checkout the log at <a href="{log_file}">{log_file}</a></div>')
             flash(success_msg, 'success')
             return redirect(url_for('accession'))
     return render_template('accession.html', error=error)
@@ -105,6 +105,7 @@ def derivatives():
         resize = form.resize.data.strip()
         density = form.density.data.strip()
         monochrome = form.monochrome.data
+        force = form.force.data
 
         if not form.validate():
             flash(form.errors, 'error')
@@ -122,27 +123,26 @@ def derivatives():
                 log_file = f"/logs/{datetime.now().strftime('%Y-%m-%dT%H.%M.%S.%f')}-convert-{packageID}.log"
                 command = [
                     "python", "-u", "/code/utilities/convertImages.py", 
-                    shlex.quote(packageID), 
-                    "-i", shlex.quote(inputFormat),
-                    "-o", shlex.quote(outputFormat)
+                    packageID, 
+                    "-i", inputFormat,
+                    "-o", outputFormat
                 ]
                 
                 if subPath:
-                    command.extend(["-p", shlex.quote(subPath)])
+                    command.extend(["-p", subPath])
                 if resize:
-                    command.extend(["-r", shlex.quote(resize)])
+                    command.extend(["-r", resize])
                 if density:
-                    command.extend(["-r", shlex.quote(density)])
+                    command.extend(["-r", density])
                 if monochrome:
                     command.append("-bw")
+                if force:
+                    command.append("--force")
                 
-                # Add log file redirection
-                safe_command = " ".join(command) + f" >> {shlex.quote(log_file)} 2>&1 &"
-                
-                print ("running command: " + safe_command)
-                convert = Popen(safe_command, shell=True, stdout=PIPE, stderr=PIPE)
+                print ("queueing command: " + " ".join(shlex.quote(arg) for arg in command))
+                job_id = enqueue("convert", command, log_file)
 
-                success_msg = Markup(f'<div>Success! Converting {inputFormat} files in {packageID} to {outputFormat}. Checkout the log at <a href="{log_file}">{log_file}</a></div>')
+                success_msg = Markup(f'<div>Success! Converting {inputFormat} files in {packageID} to {outputFormat} as job {job_id}. Checkout the log at <a href="{log_file}">{log_file}</a></div>')
                 flash(success_msg, 'success')
                 return redirect(url_for('derivatives'))
     return render_template('derivatives.html', error=error)
@@ -156,6 +156,7 @@ def av_derivatives():
         inputFormat = form.inputFormat.data.lower().strip()
         outputFormat = form.outputFormat.data.lower().strip()
         subPath = form.subPath.data.strip()
+        force = form.force.data
 
         if not form.validate():
             flash(form.errors, 'error')
@@ -173,21 +174,20 @@ def av_derivatives():
                 log_file = f"/logs/{datetime.now().strftime('%Y-%m-%dT%H.%M.%S.%f')}-convert_AV-{packageID}.log"
                 command = [
                     "python", "-u", "/code/utilities/convertAV.py", 
-                    shlex.quote(packageID), 
-                    "-i", shlex.quote(inputFormat),
-                    "-o", shlex.quote(outputFormat)
+                    packageID, 
+                    "-i", inputFormat,
+                    "-o", outputFormat
                 ]
                 
                 if subPath:
-                    command.extend(["-p", shlex.quote(subPath)])
-                
-                # Add log file redirection
-                safe_command = " ".join(command) + f" >> {shlex.quote(log_file)} 2>&1 &"
+                    command.extend(["-p", subPath])
+                if force:
+                    command.append("--force")
                 
-                print ("running command: " + safe_command)
-                convert = Popen(safe_command, shell=True, stdout=PIPE, stderr=PIPE)
+                print ("queueing command: " + " ".join(shlex.quote(arg) for arg in command))
+                job_id = enqueue("convert_AV", command, log_file)
 
-                success_msg = Markup(f'<div>Success! Converting {inputFormat} files in {packageID} to {outputFormat}. Checkout the log at <a href="{log_file}">{log_file}</a></div>')
+                success_msg = Markup(f'<div>Success! Converting {inputFormat} files in {packageID} to {outputFormat} as job {job_id}. Checkout the log at <a href="{log_file}">{log_file}</a></div>')
                 flash(success_msg, 'success')
                 return redirect(url_for('av_derivatives'))
     return render_template('av_derivatives.html', error=error)
@@ -210,6 +210,7 @@ def list():
                 print ("Copying empty Bulk_Upload_Sheet sheet to metadata directory...")
             shutil.copy2("/code/static/Bulk_Upload_Sheet.xlsx", f"/backlog/{colID}/{packageID}/metadata")
             listFiles(packageID, True, log_file)
+            log_index.record_log(log_file, "complete")
 
             success_msg = Markup(f'<div>Success! Checkout the log at <a href="{log_file}">{log_file}</a></div>')
             flash(success_msg, 'success')
@@ -268,11 +269,9 @@ def upload():
                 command.append("--processing")
                 command.append(content_warning)
 
-            safe_command = " ".join(shlex.quote(arg) for arg in command) + f" >> {shlex.quote(log_file)} 2>&1 &"
-            #print ("running command: " + safe_command)
-            upload = Popen(safe_command, shell=True, stdout=PIPE, stderr=PIPE)
+            job_id = enqueue("upload", command, log_file)
 
-            success_msg = Markup(f'<div>Success! Checkout the log at <a href="{log_file}">{log_file}</a></div>')
+            success_msg = Markup(f'<div>Success! Queued as job {job_id}. Checkout the log at <a href="{log_file}">{log_file}</a></div>')
             flash(success_msg, 'success')
             return redirect(url_for('upload'))
     return render_template('upload.html', error=error)
@@ -358,11 +357,9 @@ def recreate():
                 "--refID", refID
             ]
 
-            safe_command = " ".join(shlex.quote(arg) for arg in command) + f" >> {shlex.quote(log_file)} 2>&1 &"
-            #print ("running command: " + safe_command)
-            thumbnail = Popen(safe_command, shell=True, stdout=PIPE, stderr=PIPE)
+            job_id = enqueue("recreate", command, log_file)
 
-            success_msg = Markup(f'<div>Success! Checkout the log at <a href="{log_file}">{log_file}</a></div>')
+            success_msg = Markup(f'<div>Success! Queued as job {job_id}. Checkout the log at <a href="{log_file}">{log_file}</a></div>')
             flash(success_msg, 'success')
         
         return redirect(url_for('recreate'))
@@ -381,14 +378,13 @@ def bulk_upload():
             log_file = f"/logs/{datetime.now().strftime('%Y-%m-%dT%H.%M.%S.%f')}-bulk-{packageID}.log"
             command = [
                 "python", "-u", "/code/utilities/bulk_upload.py", 
-                shlex.quote(packageID), 
-                "--sheet", shlex.quote(sheetFile)
+                packageID, 
+                "--sheet", sheetFile
             ]
-            safe_command = " ".join(command) + f" >> {shlex.quote(log_file)} 2>&1 &"
-            print ("running command: " + safe_command)
-            bulk = Popen(safe_command, shell=True, stdout=PIPE, stderr=PIPE)
+            print ("queueing command: " + " ".join(shlex.quote(arg) for arg in command))
+            job_id = enqueue("bulk", command, log_file)
 
-            success_msg = Markup(f'<div>Success! Bulk uploading {sheetFile} in {packageID}. Checkout the log at <a href="{log_file}">{log_file}</a></div>')
+            success_msg = Markup(f'<div>Success! Bulk uploading {sheetFile} in {packageID} as job {job_id}. Checkout the log at <a href="{log_file}">{log_file}</a></div>')
             flash(success_msg, 'success')
             return redirect(url_for('bulk_upload'))
     return render_template('bulk_upload.html', error=error)
@@ -410,7 +406,7 @@ def package():
             log_file = f"/logs/{datetime.now().strftime('%Y-%m-%dT%H.%M.%S.%f')}-package-{packageID}.log"
             command = [
                 "python", "-u", "/code/utilities/packageAIP.py",
-                shlex.quote(packageID)
+                packageID
             ]
 
             if update:
@@ -418,13 +414,9 @@ def package():
             if noderivatives:
                 command.append("--noderivatives")
 
-            # Add log file redirection
-            safe_command = " ".join(command) + f" >> {shlex.quote(log_file)} 2>&1 &"
+            job_id = enqueue("package", command, log_file)
 
-            # Execute the command
-            finalize = Popen(safe_command, shell=True, stdout=PIPE, stderr=PIPE)
-
-            success_msg = Markup(f'<div>Success! Checkout the log at <a href="{log_file}">{log_file}</a></div>')
+            success_msg = Markup(f'<div>Success! Queued as job {job_id}. Checkout the log at <a href="{log_file}">{log_file}</a></div>')
             flash(success_msg, 'success')
             return redirect(url_for('package'))
 
@@ -448,50 +440,65 @@ def reindex():
                 "--id", collectionID
             ]
 
-            safe_command = " ".join(shlex.quote(arg) for arg in command) + f" >> {shlex.quote(log_file)} 2>&1 &"
-            #print ("running command: " + safe_command)
-            reindex = Popen(safe_command, shell=True, stdout=PIPE, stderr=PIPE)
+            job_id = enqueue("reindex", command, log_file)
 
-            success_msg = Markup(f'<div>Success! Checkout the log at <a href="{log_file}">{log_file}</a></div>')
+            success_msg = Markup(f'<div>Success! Queued as job {job_id}. Checkout the log at <a href="{log_file}">{log_file}</a></div>')
             flash(success_msg, 'success')
             return redirect(url_for('reindex'))
     return render_template('reindex.html', error=error)
 
+@app.get('/jobs/<int:job_id>')
+def job_status(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return {"error": f"No job {job_id}"}, 404
+    return job
+
 @app.get('/logs')
 def list_logs():
-    log_files = []
-    log_dir = "/logs"
-    for log_file in os.listdir(log_dir):
-        log_files.append(log_file)
-    log_files.sort(reverse=True)
-    return render_template('list_logs.html', log_files=log_files)
+    page = request.args.get('page', 1, type=int)
+    filters = {
+        "type": request.args.get('type', '').strip(),
+        "status": request.args.get('status', '').strip(),
+        "q": request.args.get('q', '').strip(),
+    }
+    log_files, total, job_types = log_index.list_logs(
+        page, filters["type"] or None, filters["q"] or None, filters["status"] or None,
+        force_rescan=request.args.get('rescan') == '1'
+    )
+    pages = max(1, math.ceil(total / log_index.PAGE_SIZE))
+    return render_template('list_logs.html', log_files=log_files, total=total, page=page, pages=pages, job_types=job_types, filters=filters)
 
 @app.get('/logs/<string:logFilename>')
 def view_log(logFilename):
-    log_dir = "/logs"
-    with open(os.path.join(log_dir, logFilename), "r") as f:
-        text = f.read()
-        return render_template('view_log.html', logFilename=escape(logFilename), log_text=text)
+    if not safe_join(LOG_DIR, logFilename) or not os.path.isfile(os.path.join(LOG_DIR, logFilename)):
+        abort(404)
+    return render_template('view_log.html', logFilename=escape(logFilename))
+
+@app.get('/logs/<string:logFilename>/tail')
+def tail_log(logFilename):
+    log_path = safe_join(LOG_DIR, logFilename)
+    if not log_path or not os.path.isfile(log_path):
+        abort(404)
+    offset = request.args.get('offset', type=int)
+    text, next_offset, size, truncated = read_tail(log_path, offset)
+    return {"text": text, "offset": next_offset, "size": size, "truncated": truncated}
+
+@app.get('/logs/<string:logFilename>/raw')
+def raw_log(logFilename):
+    return send_from_directory(LOG_DIR, logFilename, mimetype="text/plain")
+
+@app.get('/errors')
+def list_errors():
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    return render_template('errors.html', errors=read_errors(limit), limit=limit)
 
 @app.errorhandler(Exception)
 def handle_exception(exception):
-    error_log = "/logs/error.log"
-    now = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
-    stack_header = (
-            "****************************************************************************************************************\n"
-            + now
-            + " - "
-            + repr(exception)
-            + "\n****************************************************************************************************************\n"
-        )
-    stack_trace = stack_header + traceback.format_exc()
-    # prepend to log file
-    if not os.path.isfile(error_log):
-        open(error_log, 'x').close()
-    with open(error_log, 'r+') as f:
-        content = f.read()
-        f.seek(0, 0)
-        f.write(stack_trace + content)
+    # pass through HTTP errors like 404s
+    if isinstance(exception, HTTPException):
+        return exception
+    log_error(exception)
     return f"Internal Server Error\n{repr(exception)}", 500
 
 
@@ -1,18 +1,16 @@
 import uuid
 import os
-import asnake.logging as logging
-from asnake.client import ASnakeClient
-
-logging.setup_logging(filename="/logs/aspace-flask.log", filemode="a", level="INFO")
-client = ASnakeClient()
+from utilities.aspace_cache import cached_get, invalidate
+from utilities.aspace_client import get_client
 
 def getCollectionID(refID):
     # returns a collection ID for a refID
-    r = client.get("repositories/2/find_by_id/archival_objects?ref_id[]=" + refID)
+    client = get_client()
+    r = cached_get(client, "repositories/2/find_by_id/archival_objects?ref_id[]=" + refID, tag=refID)
     if r.status_code == 200 and len(r.json().get("archival_objects", [])) == 1:
-        item = client.get(r.json()["archival_objects"][0]["ref"]).json()
+        item = cached_get(client, r.json()["archival_objects"][0]["ref"], tag=refID).json()
         resourceURI = item["resource"]["ref"]
-        resource = client.get(resourceURI).json()
+        resource = cached_get(client, resourceURI, tag=refID).json()
         collectionID = resource["id_0"]
         
         return collectionID
@@ -27,8 +25,10 @@ def getCollectionID(refID):
     raise LookupError(f"ERROR: refID {refID} not found in ArchivesSpace or in DAO fallback collections.")
 
 def addDAO(refID, hyraxURI, log_file):
+    client = get_client()
 
-    ref = client.get("repositories/2/find_by_id/archival_objects?ref_id[]=" + refID).json()
+    ref = cached_get(client, "repositories/2/find_by_id/archival_objects?ref_id[]=" + refID, tag=refID).json()
+    # not cached since it's updated below
     item = client.get(ref["archival_objects"][0]["ref"]).json()
 
     existingDO = False
@@ -65,6 +65,7 @@ def addDAO(refID, hyraxURI, log_file):
                     "is_representative": False}                        
         item["instances"].append(daoLink)
         updateItem = client.post(item["uri"], json=item)
+        invalidate(refID)
         if updateItem.status_code != 200:
             with open(log_file, "a") as f:
                 f.write("\nFailed to attach Instance --> " + str(updateItem.status_code))
@@ -0,0 +1,45 @@
+import os
+import threading
+
+BACKLOG = "/backlog"
+
+
+class BacklogIndex:
+    """Remembers directory listings under /backlog and only lists a directory again when its mtime changes.
+
+    Checking a package costs a stat of its collection folder and of the package folder,
+    instead of listing every collection on the share.
+    """
+
+    def __init__(self, root=BACKLOG):
+        self.root = root
+        self._listings = {}
+        self._lock = threading.Lock()
+
+    def listing(self, path):
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except (FileNotFoundError, NotADirectoryError):
+            with self._lock:
+                self._listings.pop(path, None)
+            return frozenset()
+        with self._lock:
+            cached = self._listings.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        entries = frozenset(os.listdir(path))
+        with self._lock:
+            self._listings[path] = (mtime, entries)
+        return entries
+
+    def collection_path(self, package_id):
+        return os.path.join(self.root, package_id.split("_")[0])
+
+    def has_package(self, package_id):
+        return package_id in self.listing(self.collection_path(package_id))
+
+    def package_contents(self, package_id):
+        return self.listing(os.path.join(self.collection_path(package_id), package_id))
+
+
+backlog = BacklogIndex()
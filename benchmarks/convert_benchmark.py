@@ -0,0 +1,105 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+from PIL import Image, ImageDraw
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+UTILITIES = os.path.join(REPO, "utilities")
+BACKEND_COMMANDS = {"imagemagick": "convert", "vips": "vips"}
+
+# Converts every master with one backend in a fresh interpreter, one file at a time. The
+# ImageMagick or vips processes are its children, so RUSAGE_CHILDREN gives the largest of
+# them. Each child starts as a fork of this small interpreter, which sets a floor of a few
+# tens of MB on that number.
+PROBE = """
+import os, sys, json, time, resource
+sys.path.insert(0, {utilities!r})
+from convertImages import convert_image, convert_image_vips, magick_limits
+start = time.perf_counter()
+for infile, outfile in {files!r}:
+    output = []
+    if {backend!r} == "vips":
+        convert_image_vips(infile, outfile, {resize!r}, {density!r}, {monochrome!r}, output)
+    else:
+        convert_image(infile, outfile, {resize!r}, {density!r}, {monochrome!r}, magick_limits(1), output)
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": elapsed,
+    "child_max_rss_kb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    "bytes": sum(os.path.getsize(outfile) for _, outfile in {files!r}),
+}}))
+"""
+
+def make_masters(masters, count, dpi, image_format):
+    """Write letter size RGB masters at dpi, like the TIFFs that come off the scanners."""
+    width, height = int(8.5 * dpi), int(11 * dpi)
+    for i in range(count):
+        img = Image.new("RGB", (width, height), (236, 230, 214))
+        draw = ImageDraw.Draw(img)
+        for y in range(dpi, height - dpi, max(12, dpi // 5)):
+            draw.rectangle((dpi, y, width - dpi - (y * 7 + i * 131) % dpi, y + max(4, dpi // 12)), fill=(40, 36, 30))
+        img.save(os.path.join(masters, f"master-{i + 1}.{image_format}"), dpi=(dpi, dpi))
+
+def measure(backend, masters, out_dir, output_format, resize, density, monochrome):
+    os.makedirs(out_dir, exist_ok=True)
+    files = [
+        (os.path.join(masters, file), os.path.join(out_dir, f"{os.path.splitext(file)[0]}.{output_format}"))
+        for file in sorted(os.listdir(masters))
+    ]
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(
+            utilities=UTILITIES, files=files, backend=backend,
+            resize=resize, density=density, monochrome=monochrome
+        )],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        print(result.stderr)
+        raise RuntimeError(f"Converting with {backend} failed with exit code {result.returncode}")
+    run = json.loads(result.stdout.strip().splitlines()[-1])
+    run["files"] = len(files)
+    return run
+
+def main():
+    argParse = argparse.ArgumentParser(description="Compare the ImageMagick and vips backends of convertImages.py on the same masters.")
+    argParse.add_argument("--masters", default=None, help="Folder of masters to convert. By default synthetic TIFFs are made.")
+    argParse.add_argument("-n", "--count", type=int, default=3, help="Number of synthetic masters, 3 by default.")
+    argParse.add_argument("--dpi", type=int, default=600, help="Resolution of the synthetic masters, 600 by default.")
+    argParse.add_argument("-o", "--output", default="jpg", help="Output format, jpg by default.")
+    argParse.add_argument("-r", "--resize", default=None, help="Resize max pixels, e.g. '1000x1000'.")
+    argParse.add_argument("-d", "--density", default=None, help="Set resolution, e.g. '300'.")
+    argParse.add_argument("-bw", "--monochrome", action="store_true", help="Convert to monochrome.")
+    argParse.add_argument("--backends", nargs="+", default=list(BACKEND_COMMANDS), help="Backends to compare.")
+    argParse.add_argument("--dir", default=None, help="Where to write masters and output, a temporary directory by default.")
+    args = argParse.parse_args()
+
+    work = tempfile.mkdtemp(prefix="convert-benchmark-", dir=args.dir)
+    try:
+        masters = args.masters
+        if masters is None:
+            masters = os.path.join(work, "masters")
+            os.makedirs(masters)
+            make_masters(masters, args.count, args.dpi, "tif")
+        options = " ".join(filter(None, [
+            f"--resize {args.resize}" if args.resize else None,
+            f"--density {args.density}" if args.density else None,
+            "--monochrome" if args.monochrome else None,
+        ]))
+        print(f"{len(os.listdir(masters))} masters to {args.output} {options}")
+        print(f"{'backend':>12} {'seconds':>8} {'s/file':>7} {'peak RSS MB':>12} {'output MB':>10}")
+        for backend in args.backends:
+            if shutil.which(BACKEND_COMMANDS[backend]) is None:
+                print(f"{backend:>12} skipped, {BACKEND_COMMANDS[backend]} is not installed")
+                continue
+            run = measure(backend, masters, os.path.join(work, backend), args.output, args.resize, args.density, args.monochrome)
+            print(f"{backend:>12} {run['seconds']:>8.2f} {run['seconds'] / run['files']:>7.2f} {run['child_max_rss_kb'] / 1024:>12.1f} {run['bytes'] / 1024 / 1024:>10.1f}")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
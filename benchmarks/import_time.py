@@ -0,0 +1,59 @@
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in a fresh interpreter each time so nothing is already in sys.modules
+PROBE = """
+import sys, json, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+client = sys.modules.get("utilities.aspace_client")
+print(json.dumps({{
+    "seconds": elapsed,
+    "client_created": bool(client and client._client is not None),
+    "asnake_imported": "asnake.client" in sys.modules,
+}}))
+"""
+
+def measure(module):
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module)],
+        cwd=REPO, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        print(result.stderr)
+        raise RuntimeError(f"Importing {module} failed with exit code {result.returncode}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    argParse = argparse.ArgumentParser(description="Time importing the Flask app in a fresh interpreter.")
+    argParse.add_argument("-m", "--module", default="app", help="Module to import, app by default.")
+    argParse.add_argument("-n", "--runs", type=int, default=10, help="Number of fresh interpreters to time.")
+    argParse.add_argument("--max-seconds", type=float, default=None, help="Exit with an error if the median import takes longer than this.")
+    args = argParse.parse_args()
+
+    runs = [measure(args.module) for _ in range(args.runs)]
+    times = sorted(run["seconds"] for run in runs)
+    median = statistics.median(times)
+    print(f"import {args.module}: median {median * 1000:.1f} ms, min {times[0] * 1000:.1f} ms, max {times[-1] * 1000:.1f} ms over {args.runs} runs")
+
+    failed = False
+    if any(run["client_created"] for run in runs):
+        print("FAIL: an ASnakeClient was created at import time.")
+        failed = True
+    if any(run["asnake_imported"] for run in runs):
+        print("WARNING: asnake.client was imported at import time.")
+    if args.max_seconds is not None and median > args.max_seconds:
+        print(f"FAIL: median import time is over {args.max_seconds} seconds.")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import os
+import io
+import sys
+import json
+import random
+import shutil
+import argparse
+import tempfile
+import subprocess
+import img2pdf
+from PIL import Image
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+UTILITIES = os.path.join(REPO, "utilities")
+
+# Each merge runs in a fresh interpreter so its peak RSS is its own. ru_maxrss carries over
+# from the parent through exec on Linux, so the high water mark comes from /proc when it's there.
+PROBE = """
+import sys, json, time, resource
+sys.path.insert(0, {utilities!r})
+from ocr import merge_pages
+
+def max_rss_kb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+pages = open({page_list!r}).read().split()
+start = time.perf_counter()
+merge_pages(pages, {outfile!r}, {mode!r})
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "max_rss_kb": max_rss_kb()}}))
+"""
+
+def make_pages(work, count, width, height, distinct=8):
+    """Write count one page PDFs like tesseract makes, each with a noisy scanned image, cycling through a few distinct images."""
+    images = []
+    for i in range(distinct):
+        rng = random.Random(i)
+        img = Image.frombytes("L", (width, height), bytes(rng.randrange(180, 256) for _ in range(width * height)))
+        buf = io.BytesIO()
+        img.save(buf, "JPEG", quality=75, dpi=(300, 300))
+        images.append(buf.getvalue())
+    page_dir = os.path.join(work, "pages")
+    os.makedirs(page_dir, exist_ok=True)
+    pages = []
+    for i in range(count):
+        page = os.path.join(page_dir, f"page-{i + 1}.pdf")
+        with open(page, "wb") as f:
+            f.write(img2pdf.convert(images[i % distinct]))
+        pages.append(page)
+    return pages
+
+def measure(pages, mode, work):
+    page_list = os.path.join(work, "pages.txt")
+    with open(page_list, "w") as f:
+        f.write("\n".join(pages))
+    outfile = os.path.join(work, f"merged-{mode}-{len(pages)}.pdf")
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(utilities=UTILITIES, page_list=page_list, outfile=outfile, mode=mode)],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        print(result.stderr)
+        raise RuntimeError(f"Merging with {mode} failed with exit code {result.returncode}")
+    run = json.loads(result.stdout.strip().splitlines()[-1])
+
+    from pypdf import PdfReader
+    merged_pages = len(PdfReader(outfile).pages)
+    if merged_pages != len(pages):
+        raise RuntimeError(f"Merging with {mode} wrote {merged_pages} pages, expected {len(pages)}")
+    run["bytes"] = os.path.getsize(outfile)
+    os.remove(outfile)
+    return run
+
+def main():
+    argParse = argparse.ArgumentParser(description="Compare peak memory of the OCR merge modes on a synthetic PDF.")
+    argParse.add_argument("-n", "--pages", type=int, nargs="+", default=[500, 2000], help="Page counts to merge, 500 and 2000 by default.")
+    argParse.add_argument("-m", "--modes", nargs="+", default=["writer", "stream"], help="Merge modes to compare.")
+    argParse.add_argument("--size", type=int, nargs=2, default=[400, 520], metavar=("WIDTH", "HEIGHT"), help="Pixel size of each synthetic page image.")
+    argParse.add_argument("--dir", default=None, help="Where to write the synthetic pages, a temporary directory by default.")
+    args = argParse.parse_args()
+
+    work = tempfile.mkdtemp(prefix="merge-benchmark-", dir=args.dir)
+    try:
+        pages = make_pages(work, max(args.pages), *args.size)
+        print(f"{'pages':>6} {'mode':>8} {'seconds':>8} {'peak RSS MB':>12} {'output MB':>10}")
+        for count in args.pages:
+            for mode in args.modes:
+                run = measure(pages[:count], mode, work)
+                print(f"{count:>6} {mode:>8} {run['seconds']:>8.2f} {run['max_rss_kb'] / 1024:>12.1f} {run['bytes'] / 1024 / 1024:>10.1f}")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import os
+import io
+import sys
+import json
+import shutil
+import argparse
+import itertools
+import tempfile
+import subprocess
+import img2pdf
+from PIL import Image, ImageDraw, ImageFont
+from pypdf import PdfReader, PdfWriter
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+UTILITIES = os.path.join(REPO, "utilities")
+COLLECTION = "bench.001"
+
+# Runs ocr.py in a fresh interpreter against a temporary backlog. Peak RSS comes from /proc
+# for the OCR process itself, since ru_maxrss carries over through exec, and from
+# RUSAGE_CHILDREN for the largest pool worker or tesseract. wchar counts every byte the
+# process tree passed to write(), as children's I/O is added to their parent's when reaped.
+PROBE = """
+import sys, json, time, resource
+sys.path.insert(0, {utilities!r})
+import ocr
+ocr.processingDir = {backlog!r}
+sys.argv = ["ocr.py"] + {argv!r}
+
+def proc_value(path, key):
+    try:
+        with open(path) as f:
+            for line in f:
+                if line.startswith(key):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+
+start = time.perf_counter()
+ocr.main()
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": elapsed,
+    "max_rss_kb": proc_value("/proc/self/status", "VmHWM:") or resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "child_max_rss_kb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    "written": proc_value("/proc/self/io", "wchar:"),
+}}))
+"""
+
+def page_image(dpi, rotation, image_format, seed):
+    """A letter size page of text lines at dpi, turned so it reads upright once the page's /Rotate is applied."""
+    width, height = int(8.5 * dpi), int(11 * dpi)
+    img = Image.new("L", (width, height), 235)
+    draw = ImageDraw.Draw(img)
+    try:
+        font = ImageFont.load_default(size=max(10, dpi // 8))
+    except TypeError:
+        font = ImageFont.load_default()
+    line_height = max(12, dpi // 5)
+    for line, y in enumerate(range(dpi, height - dpi, line_height)):
+        draw.text((dpi, y), f"Synthetic scanned page {seed} line {line} for benchmarking OCR throughput", fill=20, font=font)
+    if rotation:
+        img = img.rotate(rotation, expand=1)
+    buf = io.BytesIO()
+    if image_format == "png":
+        img.save(buf, "PNG", dpi=(dpi, dpi))
+    else:
+        img.save(buf, "JPEG", quality=75, dpi=(dpi, dpi))
+    return buf.getvalue()
+
+def make_pdf(path, pages, dpi, rotation, image_format, distinct=4):
+    """Write an image only PDF like the ones scanned volumes come in as."""
+    images = [page_image(dpi, rotation, image_format, seed) for seed in range(min(distinct, pages))]
+    layout = img2pdf.get_fixed_dpi_layout_fun((dpi, dpi))
+    pdf = img2pdf.convert([images[i % len(images)] for i in range(pages)], layout_fun=layout)
+    if rotation:
+        writer = PdfWriter()
+        for page in PdfReader(io.BytesIO(pdf)).pages:
+            page.rotate(rotation)
+            writer.add_page(page)
+        out = io.BytesIO()
+        writer.write(out)
+        pdf = out.getvalue()
+    with open(path, "wb") as f:
+        f.write(pdf)
+
+def run_case(work, pages, dpi, rotation, image_format, ocr_args):
+    package = f"{COLLECTION}_{pages}p{dpi}dpi{rotation}r{image_format}"
+    package_path = os.path.join(work, COLLECTION, package)
+    for folder in ("derivatives", "masters", "metadata"):
+        os.makedirs(os.path.join(package_path, folder), exist_ok=True)
+    pdf = os.path.join(package_path, "derivatives", "volume.pdf")
+    make_pdf(pdf, pages, dpi, rotation, image_format)
+
+    log_path = os.path.join(work, f"{package}.log")
+    with open(log_path, "w") as log:
+        result = subprocess.run(
+            [sys.executable, "-c", PROBE.format(utilities=UTILITIES, backlog=work, argv=[package] + ocr_args)],
+            stdout=subprocess.PIPE, stderr=log, text=True
+        )
+        log.write(result.stdout)
+    if result.returncode != 0:
+        raise RuntimeError(f"OCR of {package} failed with exit code {result.returncode}, see {log_path}")
+    run = json.loads(result.stdout.strip().splitlines()[-1])
+
+    merged_pages = len(PdfReader(pdf).pages)
+    if merged_pages != pages:
+        raise RuntimeError(f"OCR of {package} wrote {merged_pages} pages, expected {pages}")
+    output = sum(os.path.getsize(os.path.join(root, file)) for root, _, files in os.walk(package_path) for file in files)
+    run["temp_bytes"] = (run["written"] - output) if run["written"] is not None else None
+    shutil.rmtree(package_path)
+    return run
+
+def main():
+    argParse = argparse.ArgumentParser(
+        description="Run utilities/ocr.py on synthetic image only PDFs and report throughput, memory and temporary disk writes.",
+        epilog="Arguments after -- are passed to ocr.py, e.g. -- --single-pass -w 4"
+    )
+    argParse.add_argument("-n", "--pages", type=int, nargs="+", default=[20], help="Page counts, 20 by default.")
+    argParse.add_argument("--dpi", type=int, nargs="+", default=[300], help="Scan resolutions, 300 by default.")
+    argParse.add_argument("--rotate", type=int, nargs="+", default=[0, 90], help="Page /Rotate values, 0 and 90 by default.")
+    argParse.add_argument("--format", nargs="+", choices=["jpeg", "png"], default=["jpeg", "png"], help="Page image formats.")
+    argParse.add_argument("--dir", default=None, help="Where to write the temporary backlog, a temporary directory by default.")
+    argParse.add_argument("ocr_args", nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    args = argParse.parse_args()
+    ocr_args = args.ocr_args[1:] if args.ocr_args[:1] == ["--"] else args.ocr_args
+
+    if shutil.which("tesseract") is None:
+        print("tesseract is not installed or not on PATH.")
+        sys.exit(1)
+
+    work = tempfile.mkdtemp(prefix="ocr-benchmark-", dir=args.dir)
+    try:
+        print(f"ocr.py {' '.join(ocr_args)}")
+        print(f"{'pages':>6} {'dpi':>5} {'rotate':>6} {'format':>6} {'seconds':>8} {'pages/s':>8} {'RSS MB':>7} {'worker RSS MB':>13} {'temp MB written':>15}")
+        for pages, dpi, rotation, image_format in itertools.product(args.pages, args.dpi, args.rotate, args.format):
+            run = run_case(work, pages, dpi, rotation, image_format, ocr_args)
+            temp = f"{run['temp_bytes'] / 1024 / 1024:.1f}" if run["temp_bytes"] is not None else "n/a"
+            print(f"{pages:>6} {dpi:>5} {rotation:>6} {image_format:>6} {run['seconds']:>8.2f} {pages / run['seconds']:>8.2f} "
+                f"{run['max_rss_kb'] / 1024:>7.1f} {run['child_max_rss_kb'] / 1024:>13.1f} {temp:>15}")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
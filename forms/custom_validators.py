@@ -1,16 +1,14 @@
 import os, json
 from wtforms import validators
-import asnake.logging as logging
-from asnake.client import ASnakeClient
 from utilities.id_normalization import normalize_collection_id
-
-logging.setup_logging(filename="/logs/aspace-flask.log", filemode="a", level="INFO")
-client = ASnakeClient()
+from utilities.aspace_cache import cached_get
+from utilities.aspace_client import get_client
+from backlog_index import backlog
 
 def validate_collectionID(form, field):
     collection_id = normalize_collection_id(field.data)
     field.data = collection_id
-    r = client.get(f"repositories/2/find_by_id/resources", params={"identifier[]": json.dumps([collection_id])})
+    r = cached_get(get_client(), "repositories/2/find_by_id/resources", params={"identifier[]": json.dumps([collection_id])}, tag=collection_id)
     if r.status_code != 200:
         raise validators.ValidationError(f'Invalid ID or ASpace request. \"{collection_id}\" returns HTTP {str(r.status_code)}')
     elif len(r.json()['resources']) != 1:
@@ -33,24 +31,19 @@ def validate_collectionID_DAO(form, field):
 def validate_accessionID(form, field):
     # check if accession exists in ASpace
     call = "repositories/2/search?page=1&aq={\"query\":{\"field\":\"identifier\", \"value\":\"" + field.data.strip() + "\", \"jsonmodel_type\":\"field_query\"}}"
-    accessionResponse = client.get(call).json()
+    accessionResponse = cached_get(get_client(), call, tag=field.data.strip()).json()
     matches = len(accessionResponse["results"])
     if matches != 1:
         raise validators.ValidationError(f'Error: Could not find accession {field.data.strip()} in ArchivesSpace, found {matches} matching accessions.')
 
 def validate_packageID(form, field):
-    available_packages = []
-    for collection_packages in os.listdir("/backlog"): 
-        if os.path.isdir(os.path.join("/backlog", collection_packages)):
-            available_packages.extend(os.listdir(os.path.join("/backlog", collection_packages)))
-    
     if not "_" in field.data:
         raise validators.ValidationError('Invalid package ID.')
     elif not field.data.startswith(("apap", "ger", "mss", "ua", "rareitem", "mathes", "etd")):
         raise validators.ValidationError('Invalid package ID. Does not start with an allowed ID prefix (apap, ger, mss, ua, rareitem, mathes, etd).')
-    elif not field.data.strip() in available_packages:
+    elif not backlog.has_package(field.data.strip()):
         raise validators.ValidationError(f'Error: Package {field.data.strip()} not found in \\\\Lincoln\\Library\\SPE_Processing\\backlog.')
-    packageDirs = os.listdir(os.path.join("/backlog", field.data.split("_")[0], field.data.strip()))
+    packageDirs = backlog.package_contents(field.data.strip())
     subfolders = ["derivatives", "masters", "metadata"]
     for subfolder in subfolders:
         if not subfolder in packageDirs:
@@ -72,7 +65,7 @@ def validate_refID(form, field):
             'Invalid ref ID. For ETD packages, ref ID must start with a 4-digit year between 1914 and 2050 followed by "-" (example: 1977-Rinaldi).'
         )
 
-    r = client.get("repositories/2/find_by_id/archival_objects?ref_id[]=" + ref_id)
+    r = cached_get(get_client(), "repositories/2/find_by_id/archival_objects?ref_id[]=" + ref_id, tag=ref_id)
     if r.status_code != 200:
         raise validators.ValidationError(f'Invalid ASpace request. \"{ref_id}\" returns HTTP {str(r.status_code)}')
     elif len(r.json()['archival_objects']) != 1:
@@ -80,7 +73,7 @@ def validate_refID(form, field):
 
 def validate_refID_recreate(form, field):
     ref_id = field.data.strip()
-    r = client.get("repositories/2/find_by_id/archival_objects?ref_id[]=" + ref_id)
+    r = cached_get(get_client(), "repositories/2/find_by_id/archival_objects?ref_id[]=" + ref_id, tag=ref_id)
     if r.status_code == 200 and len(r.json().get('archival_objects', [])) == 1:
         return
 
@@ -21,9 +21,11 @@ class DerivativesForm(Form):
     resize = StringField('Resize', [validators.Length(min=0, max=13), validate_resize])
     density = StringField('Density', [validators.Length(min=0, max=6), validate_density])
     monochrome = BooleanField()
+    force = BooleanField()
 
 class AV_DerivativesForm(Form):
     packageID = StringField('Package ID', [validators.Length(min=28, max=32), validate_packageID])
     inputFormat = StringField('Input Path', [validators.Length(min=3, max=4)])
     outputFormat = StringField('Output Path', [validators.Length(min=3, max=4)])
     subPath = StringField('Sub Path', [validators.Length(min=0, max=199)])
+    force = BooleanField()
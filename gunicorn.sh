@@ -1,2 +1,3 @@
 #!/bin/sh
+python -u jobs.py >> /logs/jobs.log 2>&1 &
 gunicorn -c gunicorn_conf.py wsgi:app
\ No newline at end of file
@@ -0,0 +1,244 @@
+import os
+import sys
+import json
+import time
+import runpy
+import sqlite3
+import threading
+import multiprocessing
+from datetime import datetime
+from subprocess import Popen, STDOUT
+
+# Job state lives on local disk, not the /logs SMB share, since SQLite locking is unreliable over SMB
+STATE_DIR = os.getenv("PROCESSING_STATE_DIR", "/var/lib/processing")
+JOBS_DB = os.path.join(STATE_DIR, "jobs.db")
+POLL_INTERVAL = 2
+
+# Jobs are limited by the resource they're bound by, so an AIP rsync can overlap with OCR
+# while two ffmpeg encodes never run at once
+RESOURCE_CLASSES = {
+    "convert": "cpu",
+    "ocr": "cpu",
+    "upload": "cpu",
+    "bulk": "cpu",
+    "recreate": "cpu",
+    "convert_AV": "av",
+    "ingest": "io",
+    "accession": "io",
+    "package": "io",
+    "reindex": "network",
+}
+CLASS_SLOTS = {
+    "cpu": int(os.getenv("PROCESSING_CPU_SLOTS", "1")),
+    "av": int(os.getenv("PROCESSING_AV_SLOTS", "1")),
+    "io": int(os.getenv("PROCESSING_IO_SLOTS", "2")),
+    "network": int(os.getenv("PROCESSING_NETWORK_SLOTS", "2")),
+}
+WORKERS = int(os.getenv("PROCESSING_WORKERS", sum(CLASS_SLOTS.values())))
+
+# Utilities run in processes forked from a server that has already imported warm_imports,
+# so a job doesn't pay for a fresh interpreter and heavy imports every time
+WARM_START = os.getenv("PROCESSING_WARM_START", "1") == "1"
+_warm_context = None
+_warm_lock = threading.Lock()
+
+# Utilities write stage timing events to a sidecar next to this log (see utilities/stage_timing.py)
+LOG_FILE_ENV = "PROCESSING_LOG_FILE"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_type TEXT NOT NULL,
+    resource_class TEXT NOT NULL DEFAULT 'cpu',
+    command TEXT NOT NULL,
+    log_file TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    pid INTEGER,
+    returncode INTEGER,
+    created TEXT NOT NULL,
+    started TEXT,
+    finished TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+"""
+
+_schema_ready = False
+
+def connect():
+    """Open a connection to the job database, creating it if needed."""
+    global _schema_ready
+    if not _schema_ready:
+        os.makedirs(STATE_DIR, exist_ok=True)
+    conn = sqlite3.connect(JOBS_DB, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    if not _schema_ready:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        columns = [row["name"] for row in conn.execute("PRAGMA table_info(jobs)")]
+        if not "resource_class" in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN resource_class TEXT NOT NULL DEFAULT 'cpu'")
+        _schema_ready = True
+    return conn
+
+def enqueue(job_type, command, log_file):
+    """Add a job to the queue and return its ID."""
+    conn = connect()
+    try:
+        cur = conn.execute(
+            "INSERT INTO jobs (job_type, resource_class, command, log_file, created) VALUES (?, ?, ?, ?, ?)",
+            (job_type, RESOURCE_CLASSES.get(job_type, "cpu"), json.dumps(command), log_file, datetime.now().isoformat())
+        )
+        from log_index import record_log
+        record_log(log_file, "queued", conn)
+        return cur.lastrowid
+    finally:
+        conn.close()
+
+def get_job(job_id):
+    conn = connect()
+    try:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+    finally:
+        conn.close()
+
+def free_classes(conn):
+    """Resource classes that have a slot open."""
+    running = dict(conn.execute(
+        "SELECT resource_class, COUNT(*) FROM jobs WHERE status = 'running' GROUP BY resource_class"
+    ).fetchall())
+    return [name for name, slots in CLASS_SLOTS.items() if running.get(name, 0) < slots]
+
+def claim_job(conn):
+    """Atomically move the oldest queued job with a free resource slot to running and return it."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        classes = free_classes(conn)
+        row = None
+        if classes:
+            row = conn.execute(
+                f"SELECT * FROM jobs WHERE status = 'queued' AND resource_class IN ({', '.join('?' for _ in classes)}) ORDER BY id LIMIT 1",
+                classes
+            ).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = 'running', started = ? WHERE id = ?",
+            (datetime.now().isoformat(), row["id"])
+        )
+        conn.execute("COMMIT")
+        return dict(row)
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+def finish_job(conn, job_id, returncode):
+    status = "complete" if returncode == 0 else "failed"
+    conn.execute(
+        "UPDATE jobs SET status = ?, returncode = ?, finished = ? WHERE id = ?",
+        (status, returncode, datetime.now().isoformat(), job_id)
+    )
+
+def requeue_interrupted(conn):
+    """Put jobs that were running when the worker pool stopped back in the queue.
+
+    Only called as the worker pool starts, before it has claimed anything, so every running job
+    was started by an earlier one. Their pids mean nothing after a restart, where another process
+    can have the same pid, so they aren't checked.
+    """
+    cur = conn.execute("UPDATE jobs SET status = 'queued', pid = NULL, started = NULL WHERE status = 'running'")
+    return cur.rowcount
+
+def warm_context():
+    global _warm_context
+    with _warm_lock:
+        if _warm_context is None:
+            _warm_context = multiprocessing.get_context("forkserver")
+            _warm_context.set_forkserver_preload(["warm_imports"])
+        return _warm_context
+
+def script_command(command):
+    """Split a ["python", "-u", script.py, args...] command into the script and its args."""
+    if not command or command[0] != "python":
+        return None
+    args = command[1:]
+    while args and args[0].startswith("-"):
+        args = args[1:]
+    if not args or not args[0].endswith(".py"):
+        return None
+    return args[0], args[1:]
+
+def run_script(script, argv, log_file):
+    """Run a utility script as __main__ in a warm process, with its output going to the job log."""
+    fd = os.open(log_file, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    os.dup2(fd, 1)
+    os.dup2(fd, 2)
+    os.close(fd)
+    sys.stdout = open(1, "w", buffering=1, closefd=False)
+    sys.stderr = open(2, "w", buffering=1, closefd=False)
+    os.environ[LOG_FILE_ENV] = log_file
+    sys.argv = [script] + list(argv)
+    sys.path.insert(0, os.path.dirname(script))
+    runpy.run_path(script, run_name="__main__")
+
+def run_job(conn, job):
+    command = json.loads(job["command"])
+    script = script_command(command) if WARM_START else None
+    if script:
+        process = warm_context().Process(target=run_script, args=(script[0], script[1], job["log_file"]))
+        process.start()
+        conn.execute("UPDATE jobs SET pid = ? WHERE id = ?", (process.pid, job["id"]))
+        process.join()
+        return process.exitcode
+    with open(job["log_file"], "a") as log:
+        p = Popen(command, stdout=log, stderr=STDOUT, env=dict(os.environ, **{LOG_FILE_ENV: job["log_file"]}))
+        conn.execute("UPDATE jobs SET pid = ? WHERE id = ?", (p.pid, job["id"]))
+        return p.wait()
+
+def worker(stop):
+    from log_index import record_log
+    conn = connect()
+    while not stop.is_set():
+        job = claim_job(conn)
+        if job is None:
+            stop.wait(POLL_INTERVAL)
+            continue
+        print(f"{datetime.now()} Starting job {job['id']} ({job['job_type']}, {job['resource_class']}) --> {job['log_file']}")
+        record_log(job["log_file"], "running", conn)
+        try:
+            returncode = run_job(conn, job)
+        except Exception as e:
+            print(f"{datetime.now()} Job {job['id']} could not run: {e!r}")
+            returncode = -1
+        finish_job(conn, job["id"], returncode)
+        record_log(job["log_file"], "complete" if returncode == 0 else "failed", conn)
+        print(f"{datetime.now()} Finished job {job['id']} with exit code {returncode}")
+
+def main(workers=WORKERS):
+    conn = connect()
+    requeued = requeue_interrupted(conn)
+    conn.close()
+    print(f"{datetime.now()} Starting {workers} workers, requeued {requeued} interrupted jobs.")
+    print(f"{datetime.now()} Resource slots: {', '.join(f'{name}={slots}' for name, slots in CLASS_SLOTS.items())}")
+
+    stop = threading.Event()
+    threads = [threading.Thread(target=worker, args=(stop,), daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    try:
+        while any(thread.is_alive() for thread in threads):
+            time.sleep(POLL_INTERVAL)
+    except KeyboardInterrupt:
+        stop.set()
+
+
+# for running the worker pool with command line args
+if __name__ == "__main__":
+    import argparse
+
+    argParse = argparse.ArgumentParser()
+    argParse.add_argument("-w", "--workers", type=int, default=WORKERS, help="Number of jobs to run at once.")
+    args = argParse.parse_args()
+
+    main(args.workers)
@@ -0,0 +1,104 @@
+import os
+import json
+import logging
+import traceback
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+LOG_DIR = "/logs"
+# Bytes shown when a log is first opened, and the most returned by one poll
+TAIL_WINDOW = 64 * 1024
+MAX_CHUNK = 256 * 1024
+
+ERROR_LOG = os.path.join(LOG_DIR, "error.log")
+ERROR_LOG_MAX_BYTES = 5 * 1024 * 1024
+ERROR_LOG_BACKUPS = 5
+BLOCK_SIZE = 64 * 1024
+
+_error_logger = None
+
+def read_tail(path, offset=None, window=TAIL_WINDOW, max_chunk=MAX_CHUNK):
+    """Read new bytes of a log from a byte offset.
+
+    With no offset, or an offset past the end of a file that was replaced, only the
+    last `window` bytes are read. Returns the text, the offset to ask for next time,
+    the file size, and whether earlier bytes were skipped.
+    """
+    size = os.path.getsize(path)
+    truncated = False
+    if offset is None or offset > size:
+        offset = max(0, size - window)
+        truncated = offset > 0
+
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read(min(max_chunk, size - offset))
+
+    if truncated:
+        # Start on a full line
+        newline = data.find(b"\n")
+        if newline != -1:
+            data = data[newline + 1:]
+            offset += newline + 1
+    next_offset = offset + len(data)
+    if next_offset < size:
+        # Stop on a full line so the next poll doesn't split a character
+        newline = data.rfind(b"\n")
+        if newline != -1:
+            data = data[:newline + 1]
+            next_offset = offset + len(data)
+
+    return data.decode("utf-8", errors="replace"), next_offset, size, truncated
+
+def error_logger():
+    global _error_logger
+    if _error_logger is None:
+        handler = RotatingFileHandler(ERROR_LOG, maxBytes=ERROR_LOG_MAX_BYTES, backupCount=ERROR_LOG_BACKUPS)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        _error_logger = logging.getLogger("processing.errors")
+        _error_logger.propagate = False
+        _error_logger.addHandler(handler)
+    return _error_logger
+
+def log_error(exception):
+    """Append one exception to the error log as a line of JSON."""
+    record = {
+        "time": datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
+        "exception": repr(exception),
+        "traceback": traceback.format_exc(),
+    }
+    error_logger().error(json.dumps(record))
+
+def read_lines_reverse(path, block_size=BLOCK_SIZE):
+    """Yield the lines of a file last to first, reading from the end in blocks."""
+    with open(path, "rb") as f:
+        position = f.seek(0, os.SEEK_END)
+        remainder = b""
+        while position > 0:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            lines = (f.read(step) + remainder).split(b"\n")
+            remainder = lines.pop(0)
+            for line in reversed(lines):
+                if line:
+                    yield line.decode("utf-8", errors="replace")
+        if remainder:
+            yield remainder.decode("utf-8", errors="replace")
+
+def read_errors(limit=50):
+    """Return the most recent errors, newest first, reading only as much of the log as needed."""
+    errors = []
+    paths = [ERROR_LOG] + [f"{ERROR_LOG}.{i}" for i in range(1, ERROR_LOG_BACKUPS + 1)]
+    for path in paths:
+        if not os.path.isfile(path):
+            continue
+        for line in read_lines_reverse(path):
+            try:
+                errors.append(json.loads(line))
+            except ValueError:
+                # skip lines left from the old prepended format
+                continue
+            if len(errors) >= limit:
+                return errors
+    return errors
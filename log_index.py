@@ -0,0 +1,136 @@
+import os
+import re
+import time
+from jobs import connect
+from log_files import LOG_DIR
+from utilities.stage_timing import TIMING_SUFFIX
+
+PAGE_SIZE = 100
+# Job logs are added as they're queued, so a full listing of the SMB share is only needed
+# to pick up files written outside the job queue
+RESCAN_INTERVAL = int(os.getenv("PROCESSING_LOG_RESCAN", "600"))
+
+# e.g. 2024-05-01T10.22.31.123456-package-ua950.012_Xf5xzeim7n4yE6tjKKHqLM.log
+LOG_NAME = re.compile(r"^(\d{4}-\d{2}-\d{2}T\d{2}\.\d{2}\.\d{2}\.\d{6})-([A-Za-z_]+)-(.+)\.log$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS logs (
+    filename TEXT PRIMARY KEY,
+    timestamp TEXT,
+    job_type TEXT,
+    package_id TEXT,
+    size INTEGER,
+    mtime REAL,
+    status TEXT
+);
+CREATE INDEX IF NOT EXISTS logs_job_type ON logs (job_type, filename);
+CREATE TABLE IF NOT EXISTS log_scan (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    dir_mtime REAL,
+    scanned REAL
+);
+"""
+
+_schema_ready = False
+
+def ensure_schema(conn):
+    global _schema_ready
+    if not _schema_ready:
+        conn.executescript(SCHEMA)
+        columns = [row["name"] for row in conn.execute("PRAGMA table_info(logs)")]
+        if not "mtime" in columns:
+            conn.execute("ALTER TABLE logs ADD COLUMN mtime REAL")
+        _schema_ready = True
+    return conn
+
+def connect_index():
+    return ensure_schema(connect())
+
+def parse_log_name(filename):
+    """Split a job log filename into its timestamp, job type and package or collection ID."""
+    match = LOG_NAME.match(filename)
+    if not match:
+        return None, None, None
+    stamp, job_type, package_id = match.groups()
+    date, clock = stamp.split("T")
+    return f"{date} {clock[:8].replace('.', ':')}", job_type, package_id
+
+def record_log(log_file, status=None, conn=None):
+    """Add or update one log in the index."""
+    filename = os.path.basename(log_file)
+    timestamp, job_type, package_id = parse_log_name(filename)
+    try:
+        stat = os.stat(log_file)
+        size, mtime = stat.st_size, stat.st_mtime
+    except OSError:
+        size, mtime = 0, None
+    own_conn = conn is None
+    if own_conn:
+        conn = connect_index()
+    else:
+        ensure_schema(conn)
+    try:
+        conn.execute(
+            """INSERT INTO logs (filename, timestamp, job_type, package_id, size, mtime, status) VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(filename) DO UPDATE SET size = excluded.size, mtime = excluded.mtime, status = COALESCE(excluded.status, logs.status)""",
+            (filename, timestamp, job_type, package_id, size, mtime, status)
+        )
+    finally:
+        if own_conn:
+            conn.close()
+
+def rescan(conn, force=False):
+    """Reconcile the index with /logs if the directory changed and the last scan is stale."""
+    dir_mtime = os.stat(LOG_DIR).st_mtime
+    row = conn.execute("SELECT dir_mtime, scanned FROM log_scan WHERE id = 1").fetchone()
+    if not force and row and (row["dir_mtime"] == dir_mtime or time.time() - row["scanned"] < RESCAN_INTERVAL):
+        return False
+
+    known = {r["filename"] for r in conn.execute("SELECT filename FROM logs")}
+    # Jobs still in the queue haven't written their logs yet
+    waiting = {os.path.basename(r["log_file"]) for r in conn.execute("SELECT log_file FROM jobs WHERE status = 'queued'")}
+    present = set()
+    conn.execute("BEGIN")
+    for entry in os.scandir(LOG_DIR):
+        if not entry.is_file() or entry.name.endswith(TIMING_SUFFIX):
+            continue
+        present.add(entry.name)
+        stat = entry.stat()
+        timestamp, job_type, package_id = parse_log_name(entry.name)
+        conn.execute(
+            """INSERT INTO logs (filename, timestamp, job_type, package_id, size, mtime) VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(filename) DO UPDATE SET size = excluded.size, mtime = excluded.mtime""",
+            (entry.name, timestamp, job_type, package_id, stat.st_size, stat.st_mtime)
+        )
+    for filename in known - present - waiting:
+        conn.execute("DELETE FROM logs WHERE filename = ?", (filename,))
+    conn.execute("INSERT OR REPLACE INTO log_scan (id, dir_mtime, scanned) VALUES (1, ?, ?)", (dir_mtime, time.time()))
+    conn.execute("COMMIT")
+    return True
+
+def list_logs(page=1, job_type=None, query=None, status=None, force_rescan=False):
+    """Return one page of logs, newest first, and the total number of matching logs."""
+    conn = connect_index()
+    try:
+        rescan(conn, force_rescan)
+        where = []
+        params = []
+        if job_type:
+            where.append("job_type = ?")
+            params.append(job_type)
+        if status:
+            where.append("status = ?")
+            params.append(status)
+        if query:
+            where.append("filename LIKE ?")
+            params.append(f"%{query}%")
+        clause = f"WHERE {' AND '.join(where)}" if where else ""
+        total = conn.execute(f"SELECT COUNT(*) FROM logs {clause}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT * FROM logs {clause} ORDER BY filename DESC LIMIT ? OFFSET ?",
+            params + [PAGE_SIZE, (max(page, 1) - 1) * PAGE_SIZE]
+        ).fetchall()
+        job_types = [r[0] for r in conn.execute("SELECT DISTINCT job_type FROM logs WHERE job_type IS NOT NULL ORDER BY job_type")]
+        return [dict(row) for row in rows], total, job_types
+    finally:
+        conn.close()
@@ -35,3 +35,6 @@ setup_dir(logs)
 
 logs = os.path.join(base, "processing_logs")
 setup_dir(logs)
+
+state = os.path.join(base, "state")
+setup_dir(state)
\ No newline at end of file
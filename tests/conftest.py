@@ -0,0 +1,8 @@
+import os
+import sys
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the utility scripts import each other as top level modules, like they do when run from utilities/
+for path in (REPO, os.path.join(REPO, "utilities")):
+    if not path in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,50 @@
+import aspace_cache
+
+class Response:
+    status_code = 200
+
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+class Client:
+    """Answers each GET with the next of a list of responses."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.gets = 0
+
+    def get(self, path, params=None):
+        self.gets += 1
+        return Response(self.responses.pop(0))
+
+def use_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(aspace_cache, "STATE_DIR", str(tmp_path))
+    monkeypatch.setattr(aspace_cache, "CACHE_DB", str(tmp_path / "aspace_cache.db"))
+    monkeypatch.setattr(aspace_cache, "_schema_ready", False)
+
+def test_empty_find_by_id_is_not_cached(tmp_path, monkeypatch):
+    use_cache(tmp_path, monkeypatch)
+    path = "repositories/2/find_by_id/archival_objects?ref_id[]=abc123"
+    found = {"archival_objects": [{"ref": "/repositories/2/archival_objects/1"}]}
+    client = Client({"archival_objects": []}, found)
+
+    assert aspace_cache.cached_get(client, path, tag="abc123").json() == {"archival_objects": []}
+    # the record was created since, so the next lookup has to reach ArchivesSpace
+    assert aspace_cache.cached_get(client, path, tag="abc123").json() == found
+    assert aspace_cache.cached_get(client, path, tag="abc123").json() == found
+    assert client.gets == 2
+
+def test_search_is_only_cached_with_one_match(tmp_path, monkeypatch):
+    use_cache(tmp_path, monkeypatch)
+    path = 'repositories/2/search?page=1&aq={"query":{"field":"identifier", "value":"2024-001", "jsonmodel_type":"field_query"}}'
+    found = {"results": [{"uri": "/repositories/2/accessions/1"}]}
+    client = Client({"results": []}, found)
+
+    assert aspace_cache.cached_get(client, path, tag="2024-001").json() == {"results": []}
+    # the accession was created after the failed submit
+    assert aspace_cache.cached_get(client, path, tag="2024-001").json() == found
+    assert aspace_cache.cached_get(client, path, tag="2024-001").json() == found
+    assert client.gets == 2
@@ -0,0 +1,72 @@
+import io
+from types import SimpleNamespace
+
+import img2pdf
+from PIL import Image
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import NameObject
+
+import ocr
+from image_dpi import has_adobe_marker, page_dpi, set_dpi, stamped_dpi
+
+def adobe_jpeg():
+    out = io.BytesIO()
+    # libjpeg writes CMYK JPEGs with an Adobe APP14 segment and no JFIF segment
+    Image.new("CMYK", (40, 30), (10, 200, 30, 0)).save(out, "JPEG")
+    return out.getvalue()
+
+def test_adobe_jpeg_is_left_alone():
+    data = adobe_jpeg()
+    assert has_adobe_marker(data)
+    assert set_dpi(data, ".jpg", (300, 300)) == data
+
+def test_plain_jpeg_gets_jfif_density():
+    out = io.BytesIO()
+    Image.new("L", (40, 30), 128).save(out, "JPEG")
+    with Image.open(io.BytesIO(set_dpi(out.getvalue(), ".jpg", (300, 300)))) as img:
+        assert img.info["dpi"] == (300, 300)
+
+def test_adobe_jpeg_resolution_goes_to_tesseract(tmp_path, monkeypatch):
+    image_path = tmp_path / "letter-1.jpg"
+    image_path.write_bytes(set_dpi(adobe_jpeg(), ".jpg", (300, 300)))
+    assert stamped_dpi(str(image_path)) is None
+    commands = []
+
+    def process(cmd):
+        commands.append(cmd)
+        return 0, []
+
+    monkeypatch.setattr(ocr, "process", process)
+    output, error, blank = ocr.ocr_page("letter.pdf", str(image_path), str(tmp_path / "letter-1"), (300, 300), None, 1, 1)
+
+    assert error is None
+    assert commands == [["tesseract", str(image_path), str(tmp_path / "letter-1"), "--dpi", "300", "pdf"]]
+
+def scanned_pdf():
+    """A one page PDF of a 600x300 image at 300 dpi."""
+    out = io.BytesIO()
+    Image.new("L", (600, 300), 255).save(out, "PNG")
+    return img2pdf.convert(out.getvalue(), layout_fun=img2pdf.get_fixed_dpi_layout_fun((300, 300)))
+
+def test_page_dpi_with_indirect_resources():
+    writer = PdfWriter()
+    writer.append(PdfReader(io.BytesIO(scanned_pdf())))
+    page = writer.pages[0]
+    page[NameObject("/Resources")] = writer._add_object(page["/Resources"])
+    out = io.BytesIO()
+    writer.write(out)
+
+    page = PdfReader(out).pages[0]
+    assert not hasattr(page.get("/Resources"), "keys")
+    assert page_dpi(page, page.images[0]) == (300, 300)
+
+def test_page_dpi_with_inherited_resources():
+    writer = PdfWriter()
+    writer.append(PdfReader(io.BytesIO(scanned_pdf())))
+    page = writer.pages[0]
+    name = next(iter(page["/Resources"]["/XObject"]))
+    resources = page["/Resources"]
+    del page["/Resources"]
+    page["/Parent"].get_object()[NameObject("/Resources")] = resources
+
+    assert page_dpi(page, SimpleNamespace(name=name[1:] + ".png")) == (300, 300)
@@ -0,0 +1,20 @@
+import os
+
+import jobs
+
+def test_requeue_interrupted_ignores_reused_pids(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "STATE_DIR", str(tmp_path))
+    monkeypatch.setattr(jobs, "JOBS_DB", str(tmp_path / "jobs.db"))
+    monkeypatch.setattr(jobs, "_schema_ready", False)
+    conn = jobs.connect()
+    for pid in (os.getpid(), None):
+        conn.execute(
+            "INSERT INTO jobs (job_type, resource_class, command, log_file, status, pid, created, started) VALUES ('ocr', 'cpu', '[]', 'x.log', 'running', ?, 'now', 'now')",
+            (pid,)
+        )
+
+    # a live pid from before the restart belongs to some other process now
+    assert jobs.requeue_interrupted(conn) == 2
+    assert "cpu" in jobs.free_classes(conn)
+    assert [row["status"] for row in conn.execute("SELECT status FROM jobs")] == ["queued", "queued"]
+    conn.close()
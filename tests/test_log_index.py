@@ -0,0 +1,29 @@
+import jobs
+import log_index
+
+def test_rescan_refreshes_sizes_and_drops_missing_logs(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "STATE_DIR", str(tmp_path))
+    monkeypatch.setattr(jobs, "JOBS_DB", str(tmp_path / "jobs.db"))
+    monkeypatch.setattr(jobs, "_schema_ready", False)
+    monkeypatch.setattr(log_index, "_schema_ready", False)
+    log_dir = tmp_path / "logs"
+    log_dir.mkdir()
+    monkeypatch.setattr(log_index, "LOG_DIR", str(log_dir))
+
+    error_log = log_dir / "error.log"
+    error_log.write_text("one\n")
+    conn = log_index.connect_index()
+    for name, status in (("ran.log", "running"), ("waiting.log", "queued")):
+        conn.execute(
+            "INSERT INTO jobs (job_type, resource_class, command, log_file, status, created) VALUES ('ocr', 'cpu', '[]', ?, ?, 'now')",
+            (str(log_dir / name), status)
+        )
+        log_index.record_log(str(log_dir / name), status, conn)
+    assert log_index.rescan(conn, force=True)
+
+    # the running job's log was deleted, the queued one hasn't been written yet
+    error_log.write_text("one\ntwo\n")
+    assert log_index.rescan(conn, force=True)
+    rows = {row["filename"]: row["size"] for row in conn.execute("SELECT filename, size FROM logs")}
+    assert rows == {"error.log": 8, "waiting.log": 0}
+    conn.close()
@@ -0,0 +1,120 @@
+import os
+import time
+import errno
+from concurrent.futures import Future, ThreadPoolExecutor
+import img2pdf
+from PIL import Image, ImageDraw
+
+import ocr
+from ocr_journal import OcrJournal
+
+HOCR = """<html><body>
+<div class='ocr_page' id='page_1' title='bbox 0 0 100 100'>one</div>
+</body></html>"""
+
+def cross_device(real):
+    """Wrap os.rename or os.replace to fail like it does between filesystems."""
+    def wrapped(src, dst, *args, **kwargs):
+        if os.path.dirname(os.path.abspath(src)) != os.path.dirname(os.path.abspath(dst)):
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        return real(src, dst, *args, **kwargs)
+    return wrapped
+
+def test_finish_document_with_scratch_on_another_filesystem(tmp_path, monkeypatch):
+    derivatives = tmp_path / "derivatives"
+    metadata = tmp_path / "metadata"
+    scratch = tmp_path / "scratch"
+    for folder in (derivatives, metadata, scratch):
+        folder.mkdir()
+    filepath = derivatives / "letter.pdf"
+    filepath.write_bytes(b"original")
+    (scratch / "letter.pdf").write_bytes(b"ocred")
+    (scratch / "letter.hocr").write_text(HOCR)
+    (scratch / "letter.txt").write_text("one\f")
+
+    ocr_file = ocr.OcrFile(str(filepath), "letter.pdf", str(scratch), OcrJournal(str(metadata)), single_pass=True)
+    ocr_file.images = ["page-1.png"]
+    ocr_file.document = Future()
+    ocr_file.document.set_result(([], None))
+    monkeypatch.setattr(os, "rename", cross_device(os.rename))
+    monkeypatch.setattr(os, "replace", cross_device(os.replace))
+
+    ocr_file.finish_document(str(tmp_path), str(metadata))
+
+    assert filepath.read_bytes() == b"ocred"
+    assert sorted(os.listdir(derivatives)) == ["letter.pdf"]
+
+def test_drain_waits_for_the_last_single_pass_document(tmp_path, monkeypatch):
+    derivatives = tmp_path / "derivatives"
+    metadata = tmp_path / "metadata"
+    work = tmp_path / "converting" / "letter"
+    for folder in (derivatives, metadata, work):
+        folder.mkdir(parents=True)
+    filepath = derivatives / "letter.pdf"
+    filepath.write_bytes(b"original")
+
+    def prepare(filepath, image_path, *args):
+        return [], None, False
+
+    def ocr_document(filepath, image_paths, outbase, dpis=None):
+        time.sleep(0.2)
+        with open(outbase + ".pdf", "wb") as f:
+            f.write(b"ocred")
+        with open(outbase + ".hocr", "w") as f:
+            f.write(HOCR)
+        with open(outbase + ".txt", "w") as f:
+            f.write("one\f")
+        return [], None
+
+    monkeypatch.setattr(ocr, "prepare_only", prepare)
+    monkeypatch.setattr(ocr, "ocr_document", ocr_document)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        pool = ocr.PagePool(executor, str(tmp_path / "converting"), str(metadata), 4)
+        ocr_file = ocr.OcrFile(str(filepath), "letter.pdf", str(work), OcrJournal(str(metadata)), single_pass=True)
+        pool.files.append(ocr_file)
+        ocr_file.pageOrder.append(str(work / "letter-1.pdf"))
+        ocr_file.images.append(str(work / "letter-1.png"))
+        pool.submit(ocr_file, str(work / "letter-1.png"), str(work / "letter-1"), (300, 300), None, 1, 1)
+        ocr_file.extracted = True
+        # the last page is ready before drain starts, so the document is only submitted inside it
+        ocr_file.futures[-1].result()
+        pool.drain()
+
+    assert pool.files == []
+    assert filepath.read_bytes() == b"ocred"
+    assert os.path.isfile(metadata / "ocr" / "letter" / "letter-1.hocr")
+
+def test_sparse_thin_strokes_are_not_blank(tmp_path):
+    # a few lines of faint one pixel pencil strokes on a letter page at 300 dpi
+    img = Image.new("L", (2550, 3300), 245)
+    draw = ImageDraw.Draw(img)
+    for y in range(600, 1000, 40):
+        for x in range(300, 2200, 6):
+            draw.line((x, y, x + 3, y + 12), fill=70, width=1)
+    page = tmp_path / "page.jpg"
+    img.save(page, quality=90)
+
+    assert ocr.ink_ratio(str(page)) > ocr.BLANK_THRESHOLD
+
+def test_empty_page_is_blank(tmp_path):
+    page = tmp_path / "page.jpg"
+    Image.new("L", (2550, 3300), 245).save(page, quality=90)
+
+    assert ocr.ink_ratio(str(page)) < ocr.BLANK_THRESHOLD
+
+def test_prescan_restores_a_backup_whose_pdf_is_missing(tmp_path):
+    derivatives = tmp_path / "derivatives"
+    metadata = tmp_path / "metadata"
+    for folder in (derivatives, metadata):
+        folder.mkdir()
+    image = tmp_path / "page.png"
+    Image.new("L", (60, 80), 255).save(image)
+    # a run stopped after moving letter.pdf aside and before writing the OCRed one
+    (derivatives / ".letter.pdf").write_bytes(img2pdf.convert(str(image)))
+    (derivatives / "._other.pdf").write_bytes(b"macOS metadata")
+
+    pdfs = ocr.prescan(str(derivatives), str(derivatives), OcrJournal(str(metadata)))
+
+    assert [pdf["rel"] for pdf in pdfs] == ["letter.pdf"]
+    assert pdfs[0]["pages"] == 1 and not pdfs[0]["done"]
+    assert sorted(os.listdir(derivatives)) == ["._other.pdf", "letter.pdf"]
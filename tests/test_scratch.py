@@ -0,0 +1,36 @@
+import os
+
+import pytest
+
+import scratch
+
+def write_owner(path, record):
+    with open(str(path) + scratch.OWNER_SUFFIX, "w") as f:
+        f.write(record)
+
+def test_claim_ignores_an_owner_whose_pid_was_reused(tmp_path):
+    job = tmp_path / "ocr-package"
+    job.mkdir()
+    # the parent is alive, but didn't start when the owner record says
+    pid = os.getppid()
+    write_owner(job, f"{pid} {scratch.boot_id() or '-'} {(scratch.process_start(pid) or 0) + 1}")
+
+    scratch.claim(str(job))
+
+    assert scratch.read_owner(str(job) + scratch.OWNER_SUFFIX)[0] == os.getpid()
+
+def test_claim_refuses_a_running_owner(tmp_path):
+    job = tmp_path / "ocr-package"
+    job.mkdir()
+    write_owner(job, scratch.owner_record(os.getppid()))
+
+    with pytest.raises(RuntimeError):
+        scratch.claim(str(job))
+
+def test_clean_orphans_removes_folders_from_before_a_restart(tmp_path):
+    job = tmp_path / "ocr-package"
+    job.mkdir()
+    write_owner(job, f"{os.getppid()} an-earlier-boot 1")
+
+    assert scratch.clean_orphans(str(tmp_path), max_age=0) == ["ocr-package"]
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,125 @@
+import os
+import json
+import time
+import sqlite3
+
+# Shared by the app's form validators and the upload scripts, so it lives on local disk
+# instead of in process memory
+STATE_DIR = os.getenv("PROCESSING_STATE_DIR", "/var/lib/processing")
+CACHE_DB = os.path.join(STATE_DIR, "aspace_cache.db")
+CACHE_TTL = int(os.getenv("ASPACE_CACHE_TTL", "600"))
+CACHE_MAX_ENTRIES = int(os.getenv("ASPACE_CACHE_MAX_ENTRIES", "5000"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS aspace_cache (
+    key TEXT PRIMARY KEY,
+    tag TEXT,
+    stored REAL NOT NULL,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS aspace_cache_tag ON aspace_cache (tag);
+CREATE INDEX IF NOT EXISTS aspace_cache_stored ON aspace_cache (stored);
+"""
+
+_schema_ready = False
+
+
+class CachedResponse:
+    """Stands in for a requests response for a cached 200."""
+
+    status_code = 200
+
+    def __init__(self, data):
+        self._data = data
+
+    def json(self):
+        return self._data
+
+
+def connect():
+    global _schema_ready
+    if not _schema_ready:
+        os.makedirs(STATE_DIR, exist_ok=True)
+    conn = sqlite3.connect(CACHE_DB, timeout=10, isolation_level=None)
+    if not _schema_ready:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        _schema_ready = True
+    return conn
+
+def cache_key(path, params=None):
+    if params:
+        return f"{path}|{json.dumps(params, sort_keys=True)}"
+    return path
+
+def empty_lookup(path, data):
+    """Whether a find_by_id lookup found nothing, or a search didn't find exactly one record,
+    which would keep saying so after the record is created."""
+    if not isinstance(data, dict):
+        return False
+    if "/search" in path:
+        return len(data.get("results") or []) != 1
+    if "/find_by_id/" in path:
+        return not any(value for value in data.values() if isinstance(value, list))
+    return False
+
+def cached_get(client, path, params=None, tag=None, ttl=CACHE_TTL):
+    """GET a read-only ArchivesSpace path, reusing a successful response less than ttl seconds old.
+
+    tag is usually the ref_id or collection ID the lookup is for, so invalidate() can drop
+    everything cached about a record after it changes. Lookups that found nothing aren't cached.
+    """
+    key = cache_key(path, params)
+    try:
+        conn = connect()
+    except sqlite3.Error as e:
+        print(f"WARNING: ArchivesSpace cache unavailable, {e}")
+        conn = None
+
+    if conn is not None:
+        try:
+            row = conn.execute("SELECT body FROM aspace_cache WHERE key = ? AND stored > ?", (key, time.time() - ttl)).fetchone()
+            if row:
+                conn.close()
+                return CachedResponse(json.loads(row[0]))
+        except sqlite3.Error:
+            pass
+
+    response = client.get(path, params=params) if params else client.get(path)
+
+    if conn is not None:
+        try:
+            if response.status_code == 200:
+                data = response.json()
+                if not empty_lookup(path, data):
+                    conn.execute(
+                        "INSERT OR REPLACE INTO aspace_cache (key, tag, stored, body) VALUES (?, ?, ?, ?)",
+                        (key, tag, time.time(), json.dumps(data))
+                    )
+                    prune(conn, ttl)
+        except (sqlite3.Error, ValueError):
+            pass
+        finally:
+            conn.close()
+    return response
+
+def prune(conn, ttl=CACHE_TTL, max_entries=None):
+    """Drop expired entries and the oldest entries over the size bound."""
+    if max_entries is None:
+        max_entries = CACHE_MAX_ENTRIES
+    conn.execute("DELETE FROM aspace_cache WHERE stored <= ?", (time.time() - ttl,))
+    conn.execute(
+        "DELETE FROM aspace_cache WHERE key IN (SELECT key FROM aspace_cache ORDER BY stored DESC LIMIT -1 OFFSET ?)",
+        (max_entries,)
+    )
+
+def invalidate(tag):
+    """Forget every cached lookup for a ref_id or collection ID, e.g. after writing a digital object."""
+    try:
+        conn = connect()
+        try:
+            conn.execute("DELETE FROM aspace_cache WHERE tag = ?", (tag,))
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"WARNING: Could not clear ArchivesSpace cache for {tag}, {e}")
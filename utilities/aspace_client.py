@@ -0,0 +1,22 @@
+import threading
+
+ASPACE_LOG = "/logs/aspace-flask.log"
+
+_client = None
+_lock = threading.Lock()
+
+def get_client():
+    """Return the process's shared ASnakeClient, setting up logging and the client on first use.
+
+    The client keeps one requests session, so lookups from the validators, aspaceDAO and
+    add_items reuse its connections, and importing the app doesn't import ASnake at all.
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                import asnake.logging as logging
+                from asnake.client import ASnakeClient
+                logging.setup_logging(filename=ASPACE_LOG, filemode="a", level="INFO")
+                _client = ASnakeClient()
+    return _client
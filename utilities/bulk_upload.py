@@ -7,18 +7,15 @@ import shutil
 import iiiflow
 import argparse
 from openpyxl import load_workbook
-import asnake.logging as logging
-from asnake.client import ASnakeClient
 from datetime import datetime, timezone
 from pathlib import Path, PureWindowsPath, PurePosixPath
+from aspace_cache import cached_get, invalidate
+from aspace_client import get_client
+from ocr_sidecars import import_sidecars
 
 processingDir = "/backlog"
 SPE_DAO = "/SPE_DAO"
 
-# Setup ASpace connection
-logging.setup_logging(filename="/logs/aspace-flask.log", filemode="a", level="INFO")
-client = ASnakeClient()
-
 PREFIXES = ["apap", "ger", "mss", "ua"]
 def validate_col_id(col_id: str) -> bool:
     pattern = r'^(apap\d{3}|ger\d{3}|mss\d{3}|ua\d{3}(?:\.\d{3})?)$'
@@ -348,6 +345,7 @@ for item in ordered_items:
     else:
         format_path = os.path.join(object_path, input_fmt.lower())
     os.mkdir(format_path)
+    access_files = []
     if os.path.isdir(file_path):
         input_fmt_lower = input_fmt.lower().strip()
         for walk_root, _, walk_files in os.walk(file_path):
@@ -364,6 +362,7 @@ for item in ordered_items:
                 elif input_file_lower.endswith(f".{input_fmt_lower}"):
                     print (f"\t\tMoving {input_file_path} to {format_path}...")
                     shutil.copy2(input_file_path, format_path)
+                    access_files.append(input_file_path)
     elif os.path.isfile(file_path):
         if input_fmt.lower() == "ogg_mp3":
             src = Path(file_path)
@@ -400,6 +399,7 @@ for item in ordered_items:
             shutil.copy2(paired_source, dest_associated)
         else:
             shutil.copy2(file_path, format_path)
+            access_files.append(file_path)
     else:
         raise FileNotFoundError(f"Error: File path {file_path} does not exist.")
 
@@ -429,8 +429,12 @@ for item in ordered_items:
 
     # OCR/transcription
     if input_fmt.lower() in img_formats:
-        print ("\tRecognizing text...")
-        iiiflow.create_hocr(ID, aspace_id)
+        # reuse hOCR from ocr.py --single-pass if there is some for every image
+        if import_sidecars(object_path, derivatives_path, os.path.join(processingDir, ID, args.package, "metadata"), access_files):
+            print ("\tUsing hOCR and text from the package's OCR run...")
+        else:
+            print ("\tRecognizing text...")
+            iiiflow.create_hocr(ID, aspace_id)
     elif input_fmt.lower() in ("ogg", "mp3", "ogg_mp3", "webm"):
         print ("\tTranscribing...")
         iiiflow.create_transcription(ID, aspace_id)
@@ -487,7 +491,8 @@ for item in ordered_items:
     }
 
     # Upload new digital object
-    ref = client.get("repositories/2/find_by_id/archival_objects?ref_id[]=" + aspace_id).json()
+    client = get_client()
+    ref = cached_get(client, "repositories/2/find_by_id/archival_objects?ref_id[]=" + aspace_id, tag=aspace_id).json()
     item = client.get(ref["archival_objects"][0]["ref"]).json()
     new_dao = client.post("repositories/2/digital_objects", json=dao_object)
     if new_dao.status_code != 200:
@@ -530,6 +535,7 @@ for item in ordered_items:
         print (f"Added processing note.")
     """
     update_item = client.post(item["uri"], json=item)
+    invalidate(aspace_id)
     if update_item.status_code == 200:
         print (f"Updated archival object record --> {update_item.status_code}")
     else:
@@ -4,6 +4,8 @@ from datetime import datetime
 from subprocess import run, PIPE
 from pathlib import PureWindowsPath, PurePosixPath
 import json
+from stage_timing import stage
+from derivative_manifest import DerivativeManifest
 
 # Base processing directory
 PROCESSING_DIR = "/backlog"
@@ -67,7 +69,12 @@ def convert_av(infile, outfile, extra_args=None):
     if extra_args:
         cmd.extend(extra_args)
     cmd.append(outfile)
-    run_command(cmd)
+    with stage("ffmpeg encode", input=infile, output=outfile, bytes=os.path.getsize(infile), duration=dur) as timing:
+        result = run_command(cmd, check=False)
+        timing["returncode"] = result.returncode
+        if result.returncode != 0:
+            raise RuntimeError(f"Command failed: {' '.join(cmd)}")
+        timing["output_bytes"] = os.path.getsize(outfile)
 
     # Print converted file metadata
     meta_out = get_av_metadata(outfile)
@@ -84,6 +91,7 @@ def parse_args():
     parser.add_argument("-i", "--input", required=True, choices=all_input_formats, help="Input format")
     parser.add_argument("-o", "--output", required=True, help="Output format (mp3, ogg, webm).")
     parser.add_argument("-p", "--path", help="Subpath relative to masters directory.", default=None)
+    parser.add_argument("-f", "--force", action="store_true", help="Rebuild every derivative, even ones the manifest says are up to date.")
     return parser.parse_args()
 
 def main():
@@ -123,37 +131,46 @@ def main():
         input_exts = [f".{args.input.lower()}"]
     
     # Conversion loop
-    for root, _, files in os.walk(masters):
-        for file in files:
-            ext = os.path.splitext(file)[1].lower()
-            if ext not in input_exts:
-                continue
-
-            infile = os.path.join(root, file)
-            rel_root = os.path.relpath(root, masters)
-            out_dir = os.path.join(derivatives, rel_root)
-            os.makedirs(out_dir, exist_ok=True)
-
-            base_name = os.path.splitext(file)[0]
-            out_file = os.path.join(out_dir, f"{base_name}.{args.output.lower()}")
-
-            # Set sensible defaults for ffmpeg conversions
-            extra_args = []
-            if args.input.lower() in audio_formats and args.output.lower() == "mp3":
-                extra_args = ["-codec:a", "libmp3lame", "-q:a", "2"]
-            elif args.input.lower() in audio_formats and args.output.lower() == "ogg":
-                extra_args = ["-codec:a", "libvorbis", "-q:a", "5"]
-            elif args.input.lower() in video_formats and args.output.lower() == "webm":
-                extra_args = [
-                    "-codec:v", "libvpx",
-                    "-b:v", "1M",
-                    "-codec:a", "libvorbis",
-                    "-auto-alt-ref", "0",
-                    "-row-mt", "1",
-                ]
-
-            print(f"\nConverting {infile} → {out_file}")
-            convert_av(infile, out_file, extra_args)
+    with DerivativeManifest(metadata, force=args.force) as manifest:
+        for root, _, files in os.walk(masters):
+            for file in files:
+                ext = os.path.splitext(file)[1].lower()
+                if ext not in input_exts:
+                    continue
+
+                infile = os.path.join(root, file)
+                rel_root = os.path.relpath(root, masters)
+                out_dir = os.path.join(derivatives, rel_root)
+                os.makedirs(out_dir, exist_ok=True)
+
+                base_name = os.path.splitext(file)[0]
+                out_file = os.path.join(out_dir, f"{base_name}.{args.output.lower()}")
+
+                # Set sensible defaults for ffmpeg conversions
+                extra_args = []
+                if args.input.lower() in audio_formats and args.output.lower() == "mp3":
+                    extra_args = ["-codec:a", "libmp3lame", "-q:a", "2"]
+                elif args.input.lower() in audio_formats and args.output.lower() == "ogg":
+                    extra_args = ["-codec:a", "libvorbis", "-q:a", "5"]
+                elif args.input.lower() in video_formats and args.output.lower() == "webm":
+                    extra_args = [
+                        "-codec:v", "libvpx",
+                        "-b:v", "1M",
+                        "-codec:a", "libvorbis",
+                        "-auto-alt-ref", "0",
+                        "-row-mt", "1",
+                    ]
+
+                params = {"output": args.output.lower(), "ffmpeg": extra_args}
+                if manifest.up_to_date(out_file, [infile], params):
+                    print(f"Skipping {infile}, up to date.")
+                    continue
+
+                print(f"\nConverting {infile} → {out_file}")
+                convert_av(infile, out_file, extra_args)
+                manifest.record(out_file, [infile], params)
+
+    print(manifest.summary())
 
     print("Complete!")
     print(f"Finished at {datetime.now()}")
@@ -1,10 +1,21 @@
 import os
+import time
+import queue
 import shutil
+import io
 import img2pdf
+import tempfile
 import argparse
+import functools
+from collections import deque
 from datetime import datetime
 from subprocess import run, PIPE
-from pathlib import PureWindowsPath, PurePosixPath
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path, PureWindowsPath, PurePosixPath
+from stage_timing import stage
+from scratch import scratch_dir, SCRATCH_DIR
+from derivative_manifest import DerivativeManifest
+from pdf_stream import StreamingPdfWriter
 
 # Base processing directory
 PROCESSING_DIR = "/backlog"
@@ -17,19 +28,43 @@ else:
     IMAGEMAGICK_CMD = "convert"
     PDF_MERGE_CMD = ["pdfunite"]
 
-def run_command(cmd, check=True):
-    """Run a shell command and print output."""
-    print("Running:", " ".join(cmd))
-    result = run(cmd, stdout=PIPE, stderr=PIPE, text=True)
+# Image conversions run at once, each limited to one ImageMagick thread
+CONVERT_WORKERS = int(os.getenv("PROCESSING_CONVERT_WORKERS", os.cpu_count() or 1))
+# Pixel cache RAM for each ImageMagick, beyond which it uses memory mapped files and then disk.
+# By default the workers share half of the machine's memory.
+CONVERT_MEMORY_MB = os.getenv("PROCESSING_CONVERT_MEMORY_MB")
+
+# libvips streams images through in strips instead of decoding the whole raster like ImageMagick
+BACKENDS = ("imagemagick", "vips")
+CONVERT_BACKEND = os.getenv("PROCESSING_CONVERT_BACKEND", "imagemagick")
+VIPS_CMD = "vips"
+# vips thumbnail needs both a width and a height, so a side -resize leaves out gets one nothing reaches
+VIPS_UNBOUNDED = "10000000"
+
+# Most pages in a PDF made from a folder of images before it's split into volumes, 0 for no limit
+PDF_MAX_PAGES = int(os.getenv("PROCESSING_PDF_MAX_PAGES", "0"))
+
+OFFICE_INPUTS = ("doc", "docx", "xls", "xlsx", "ppt", "pptx", "csv")
+# Office files converted by one LibreOffice, so a crash only loses a batch, and seconds each one gets before it's killed
+OFFICE_BATCH_SIZE = int(os.getenv("PROCESSING_OFFICE_BATCH_SIZE", "50"))
+OFFICE_TIMEOUT = int(os.getenv("PROCESSING_OFFICE_TIMEOUT", "120"))
+
+def run_command(cmd, check=True, stage_name=None, source=None, output=None, timeout=None):
+    """Run a shell command and print output, or add it to the output list to print later."""
+    log = print if output is None else lambda *parts: output.append(" ".join(parts))
+    log("Running:", " ".join(cmd))
+    with stage(stage_name or os.path.basename(cmd[0]), input=source) as timing:
+        result = run(cmd, stdout=PIPE, stderr=PIPE, text=True, timeout=timeout)
+        timing["returncode"] = result.returncode
     if result.stdout:
-        print(result.stdout)
+        log(result.stdout)
     if result.stderr:
-        print(result.stderr)
+        log(result.stderr)
     if check and result.returncode != 0:
         raise RuntimeError(f"Command failed: {' '.join(cmd)}")
     return result
 
-def extract_from_pdf(filepath, outprefix, fmt):
+def extract_from_pdf(filepath, outprefix, fmt, output=None):
     """Convert PDF pages to images using pdftoppm."""
     cmd = ["pdftoppm", filepath, outprefix]
     if fmt == "jpg":
@@ -38,17 +73,63 @@ def extract_from_pdf(filepath, outprefix, fmt):
         cmd.append("-png")
     else:
         raise ValueError(f"Unsupported output format {fmt}")
-    run_command(cmd)
+    run_command(cmd, stage_name="pdftoppm", source=filepath, output=output)
+
+def volume_path(output_pdf, number):
+    base, ext = os.path.splitext(output_pdf)
+    return f"{base}-{number}{ext}"
 
-def convert_images_to_pdf(input_files, output_pdf):
-    """Convert image files to a single PDF."""
+def convert_images_to_pdf(input_files, output_pdf, max_pages=0):
+    """Convert image files to a PDF, or volumes of at most max_pages pages. Returns the PDFs written.
+
+    Each image is made into a PDF page by img2pdf on its own and written straight to the output,
+    so memory only ever holds one image. A folder that needs more than one volume is written to
+    output-1.pdf, output-2.pdf and so on instead of output.pdf. A multi-page TIFF is never split,
+    so its volume can run over by its extra pages.
+    """
     print(f"Converting {len(input_files)} images to {output_pdf}")
-    with open(output_pdf, "wb") as f:
-        f.write(img2pdf.convert(input_files))
+    volumes = [output_pdf]
+    pages = 0
+    with stage("img2pdf", output=output_pdf, files=len(input_files)) as timing:
+        writer = StreamingPdfWriter(output_pdf)
+        try:
+            for infile in input_files:
+                if max_pages and pages >= max_pages:
+                    writer.close()
+                    if len(volumes) == 1:
+                        os.replace(output_pdf, volume_path(output_pdf, 1))
+                        volumes[0] = volume_path(output_pdf, 1)
+                    volumes.append(volume_path(output_pdf, len(volumes) + 1))
+                    print(f"Starting volume {len(volumes)} at {infile}")
+                    writer = StreamingPdfWriter(volumes[-1])
+                    pages = 0
+                # a multi-page TIFF makes more than one page
+                pages += writer.append(io.BytesIO(img2pdf.convert(infile)))
+        except BaseException:
+            writer.stream.close()
+            raise
+        writer.close()
+        timing["volumes"] = len(volumes)
+        timing["bytes"] = sum(os.path.getsize(volume) for volume in volumes)
+    if len(volumes) > 1:
+        for volume in volumes:
+            print(f"Wrote {volume}")
+    return volumes
+
+def magick_limits(workers, memory_mb=CONVERT_MEMORY_MB):
+    """ImageMagick resource limits for one of a number of conversions running at once."""
+    if memory_mb is None:
+        try:
+            total_mb = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024)
+        except (ValueError, OSError, AttributeError):
+            total_mb = 4096
+        memory_mb = max(64, total_mb // 2 // max(1, workers))
+    memory_mb = int(memory_mb)
+    return ["-limit", "thread", "1", "-limit", "memory", f"{memory_mb}MiB", "-limit", "map", f"{memory_mb * 2}MiB"]
 
-def convert_image(infile, outfile, resize=None, density=None, monochrome=False):
+def convert_image(infile, outfile, resize=None, density=None, monochrome=False, limits=None, output=None):
     """Convert a single image to another format."""
-    cmd = [IMAGEMAGICK_CMD, infile]
+    cmd = [IMAGEMAGICK_CMD] + (limits or []) + [infile]
     if resize:
         cmd += ["-resize", resize]
     if density:
@@ -56,15 +137,181 @@ def convert_image(infile, outfile, resize=None, density=None, monochrome=False):
     if monochrome:
         cmd.append("-monochrome")
     cmd.append(outfile)
-    run_command(cmd)
+    run_command(cmd, stage_name="convert image", source=infile, output=output)
+
+def vips_resize(resize):
+    """Turn an ImageMagick -resize geometry, like 1000x1000, 1000, x800, 1000x1000> or 50%, into a vips operation and its arguments."""
+    geometry = resize.strip()
+    if geometry.endswith("%"):
+        return "resize", [str(float(geometry[:-1]) / 100)]
+    size = "both"
+    flags = {">": "down", "<": "up", "!": "force"}
+    while geometry and geometry[-1] in flags:
+        size = flags[geometry[-1]]
+        geometry = geometry[:-1]
+    width, _, height = geometry.partition("x")
+    # convert doesn't apply EXIF orientation unless told to, so neither does this
+    return "thumbnail", [width or VIPS_UNBOUNDED, "--height", height or VIPS_UNBOUNDED, "--size", size, "--no-rotate"]
+
+def convert_image_vips(infile, outfile, resize=None, density=None, monochrome=False, output=None):
+    """Convert a single image with vips, taking the same resize, density and monochrome options as convert_image.
+
+    Each step is a vips command, with the steps between them written to uncompressed .v files
+    in the system temp directory. These are the full size of the raster, so they stay off the
+    scratch directory, which may be in RAM. Like convert, EXIF orientation is kept as a tag
+    rather than applied. Monochrome differs from convert's -monochrome, which dithers: it is a
+    plain threshold at 50% gray, saved as 1 bit for PNG and TIFF.
+    """
+    steps = []
+    if resize:
+        steps.append(vips_resize(resize))
+    if monochrome:
+        steps.append(("colourspace", ["b-w"]))
+        steps.append(("relational_const", ["more", "127"]))
+    if density:
+        # vips resolution is in pixels per millimeter
+        res = f"{float(density) / 25.4:.4f}"
+        steps.append(("copy", ["--xres", res, "--yres", res]))
+    if not steps:
+        steps.append(("copy", []))
+
+    save = outfile
+    if monochrome and os.path.splitext(outfile)[1].lower() in (".png", ".tif", ".tiff"):
+        save += "[bitdepth=1]"
+    workDir = tempfile.mkdtemp(prefix="vips-")
+    try:
+        source = infile
+        for count, (operation, operation_args) in enumerate(steps, 1):
+            dest = save if count == len(steps) else os.path.join(workDir, f"step{count}.v")
+            cmd = [VIPS_CMD, operation, source, dest] + operation_args + ["--vips-concurrency=1"]
+            run_command(cmd, stage_name=f"vips {operation}", source=infile, output=output)
+            source = dest
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+def timed(description, fn, *args):
+    """Pool worker that runs a conversion with an output list. Returns its output to print in order, and the error if it failed."""
+    output = []
+    start = time.perf_counter()
+    try:
+        fn(*args, output=output)
+        error = None
+    except Exception as e:
+        error = e
+    output.append(f"{description} in {time.perf_counter() - start:.2f}s")
+    return output, error
+
+class ConvertPool:
+    """Runs conversions in worker threads, printing each one's output in the order they were submitted.
+
+    Only a couple of conversions per worker are queued ahead, so walking a huge masters folder
+    doesn't queue every file at once, and the first failure stops the run. A done callback
+    runs in the main thread once its conversion has succeeded.
+    """
+
+    def __init__(self, workers):
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.futures = deque()
+        self.max_pending = workers * 2
+
+    def submit(self, fn, *args, done=None):
+        while len(self.futures) >= self.max_pending:
+            self.report_next()
+        self.futures.append((self.executor.submit(fn, *args), done))
 
-def convert_office_to_pdf(infile, outdir):
-    """Convert Office docs to PDF using LibreOffice in headless mode."""
-    cmd = [
-        "libreoffice", "--headless", "--convert-to", "pdf",
-        "--outdir", outdir, infile
-    ]
-    run_command(cmd)
+    def report_next(self):
+        future, done = self.futures.popleft()
+        output, error = future.result()
+        for line in output:
+            print(line)
+        if error:
+            raise error
+        if done:
+            done()
+
+    def drain(self):
+        while self.futures:
+            self.report_next()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.executor.shutdown(wait=True, cancel_futures=exc_type is not None)
+        return False
+
+def office_batches(infiles, size):
+    """Split Office files into batches of at most size, with no two files in a batch sharing a name,
+    since LibreOffice names each PDF after its file."""
+    batches = []
+    for infile in infiles:
+        stem = os.path.splitext(os.path.basename(infile))[0]
+        for batch, stems in batches:
+            if len(batch) < size and not stem in stems:
+                batch.append(infile)
+                stems.add(stem)
+                break
+        else:
+            batches.append(([infile], {stem}))
+    return [batch for batch, stems in batches]
+
+def convert_office_to_pdf(infiles, outdir, profiles, output=None):
+    """Convert a batch of Office docs to PDF with one headless LibreOffice.
+
+    Each LibreOffice takes a user profile from the profiles queue, since instances sharing a
+    profile block each other, and the profile stays warm for the next batch.
+    """
+    profile = profiles.get()
+    try:
+        cmd = [
+            "libreoffice", f"-env:UserInstallation={Path(profile).as_uri()}", "--headless",
+            "--convert-to", "pdf", "--outdir", outdir
+        ] + infiles
+        run_command(cmd, stage_name="libreoffice", source=f"{len(infiles)} files", output=output, timeout=OFFICE_TIMEOUT * len(infiles))
+    finally:
+        profiles.put(profile)
+
+def page_images(outprefix, fmt):
+    """The page images pdftoppm wrote for outprefix, like outprefix-01.jpg."""
+    out_dir, name = os.path.split(outprefix)
+    return sorted(
+        os.path.join(out_dir, file) for file in os.listdir(out_dir)
+        if file.startswith(f"{name}-") and file.endswith(f".{fmt}")
+    )
+
+def convert_office_files(office_files, tmp_pdf_dir, fmt, workers, done=None):
+    """Convert Office files to PDFs in batches, several LibreOffices at once, then extract their pages in order.
+    done is called with each file and its outprefix once its pages are extracted."""
+    batch_size = max(1, min(OFFICE_BATCH_SIZE, -(-len(office_files) // workers)))
+    batches = office_batches([infile for infile, outprefix in office_files], batch_size)
+    print(f"Converting {len(office_files)} Office files to PDF in {len(batches)} batches, up to {workers} at once")
+    # profiles stay on local disk even when tmp_pdf_dir falls back to the package on the share,
+    # where LibreOffice's profile I/O is slow and hits locking errors
+    profile_dir = tempfile.mkdtemp(prefix="libreoffice-profiles-", dir=SCRATCH_DIR)
+    profiles = queue.Queue()
+    for count in range(min(workers, len(batches))):
+        profiles.put(os.path.join(profile_dir, f"profile-{count + 1}"))
+
+    pdfs = {}
+    try:
+        with ConvertPool(workers) as pool:
+            for count, batch in enumerate(batches, 1):
+                outdir = os.path.join(tmp_pdf_dir, f"batch-{count}")
+                for infile in batch:
+                    pdfs[infile] = os.path.join(outdir, f"{os.path.splitext(os.path.basename(infile))[0]}.pdf")
+                pool.submit(timed, f"Converted batch {count} of {len(batches)}, {len(batch)} files", convert_office_to_pdf, batch, outdir, profiles)
+            pool.drain()
+    finally:
+        # after the pool has shut down, so no LibreOffice is still using one
+        shutil.rmtree(profile_dir, ignore_errors=True)
+
+    with ConvertPool(workers) as pool:
+        for infile, outprefix in office_files:
+            if not os.path.isfile(pdfs[infile]):
+                raise RuntimeError(f"LibreOffice did not convert {infile} to PDF")
+            pool.submit(timed, f"Extracted {infile}", extract_from_pdf, pdfs[infile], outprefix, fmt,
+                done=functools.partial(done, infile, outprefix) if done else None)
+        pool.drain()
 
 def parse_args():
     parser = argparse.ArgumentParser()
@@ -74,7 +321,11 @@ def parse_args():
     parser.add_argument("-p", "--path", help="Subpath relative to masters directory.", default=None)
     parser.add_argument("-r", "--resize", help="Resize max pixels, e.g. '1000x1000'.")
     parser.add_argument("-d", "--density", help="Set resolution, e.g. '300'.")
-    parser.add_argument("-bw", "--monochrome", help="Convert to monochrome", action="store_true")
+    parser.add_argument("-bw", "--monochrome", help="Convert to monochrome. ImageMagick dithers, vips thresholds at 50%% gray without dithering.", action="store_true")
+    parser.add_argument("-b", "--backend", choices=BACKENDS, default=CONVERT_BACKEND, help="Convert images to images with ImageMagick convert or libvips. Neither applies EXIF orientation, and they differ in --monochrome.")
+    parser.add_argument("-w", "--workers", type=int, default=CONVERT_WORKERS, help="Number of images to convert at once.")
+    parser.add_argument("-m", "--max-pages", type=int, default=PDF_MAX_PAGES, help="Split PDFs made from images into volumes of at most this many pages.")
+    parser.add_argument("-f", "--force", action="store_true", help="Rebuild every derivative, even ones the manifest says are up to date.")
     return parser.parse_args()
 
 def main():
@@ -117,56 +368,99 @@ def main():
         input_exts = [".jpg", ".jpeg"]
 
     # Conversion logic
-    if args.output.lower() == "pdf":
-        # Images -> PDF
-        for root, _, files in os.walk(masters):
-            imgs = [os.path.join(root, f) for f in sorted(files) if os.path.splitext(f)[1].lower() in input_exts]
-            if imgs:
-                rel_root = os.path.relpath(root, masters)
-                out_dir = os.path.join(derivatives, rel_root)
-                os.makedirs(out_dir, exist_ok=True)
-                out_pdf = os.path.join(out_dir, os.path.basename(root) + ".pdf")
-                convert_images_to_pdf(imgs, out_pdf)
-    else:
-        # PDF or images -> images
-        for root, _, files in os.walk(masters):
-            for file in files:
-                ext = os.path.splitext(file)[1].lower()
-                if ext not in input_exts:
-                    continue
-
-                infile = os.path.join(root, file)
-                rel_root = os.path.relpath(root, masters)
-                out_dir = os.path.join(derivatives, rel_root)
-                os.makedirs(out_dir, exist_ok=True)
-
-                base_name = os.path.splitext(file)[0]
-                # for PDF/Office, create a subfolder with the filename
-                if args.input.lower() in ("pdf", "doc", "docx", "xls", "xlsx", "ppt", "pptx", "csv"):
-                    doc_out_dir = os.path.join(out_dir, base_name)
-                    os.makedirs(doc_out_dir, exist_ok=True)
-                    outprefix = os.path.join(doc_out_dir, base_name)
-                else:
-                    doc_out_dir = out_dir
-                    outprefix = os.path.join(doc_out_dir, base_name)
-
-                if args.input.lower() == "pdf":
-                    extract_from_pdf(infile, outprefix, args.output.lower())
-                elif args.input.lower() in ("doc", "docx", "xls", "xlsx", "ppt", "pptx", "csv"):
-                    tmp_pdf_dir = os.path.join(package, "tmp_pdf")
-                    os.makedirs(tmp_pdf_dir, exist_ok=True)
-                    convert_office_to_pdf(infile, tmp_pdf_dir)
-                    tmp_pdf = os.path.join(tmp_pdf_dir, f"{base_name}.pdf")
-                    extract_from_pdf(tmp_pdf, outprefix, args.output.lower())
+    fmt = args.output.lower()
+    with DerivativeManifest(metadata, force=args.force) as manifest:
+        if fmt == "pdf":
+            # Images -> PDF
+            params = {"output": fmt, "max_pages": args.max_pages}
+            for root, _, files in os.walk(masters):
+                imgs = [os.path.join(root, f) for f in sorted(files) if os.path.splitext(f)[1].lower() in input_exts]
+                if imgs:
+                    rel_root = os.path.relpath(root, masters)
+                    out_dir = os.path.join(derivatives, rel_root)
+                    os.makedirs(out_dir, exist_ok=True)
+                    out_pdf = os.path.join(out_dir, os.path.basename(root) + ".pdf")
+                    if manifest.up_to_date(out_pdf, imgs, params):
+                        print(f"Skipping {out_pdf}, up to date.")
+                        continue
+                    previous = manifest.recorded_outputs(out_pdf)
+                    volumes = convert_images_to_pdf(imgs, out_pdf, args.max_pages)
+                    # volumes from a run split differently would be left looking like part of this one
+                    for stale in set(previous) - set(os.path.normpath(volume) for volume in volumes):
+                        if os.path.isfile(stale):
+                            os.remove(stale)
+                            print(f"Removed {stale} from an earlier run")
+                    manifest.record(out_pdf, imgs, params, volumes)
+        else:
+            # PDF or images -> images
+            workers = max(1, args.workers)
+            limits = magick_limits(workers)
+            image_input = not args.input.lower() in ("pdf",) + OFFICE_INPUTS
+            if image_input and args.backend == "vips":
+                print(f"Converting up to {workers} images at once, each with single-threaded vips")
+            elif image_input:
+                print(f"Converting up to {workers} images at once, each with ImageMagick {' '.join(limits)}")
+            if image_input:
+                params = {"output": fmt, "backend": args.backend, "resize": args.resize, "density": args.density, "monochrome": args.monochrome}
+            else:
+                params = {"output": fmt}
+            office_files = []
+            with ConvertPool(workers) as pool:
+                for root, _, files in os.walk(masters):
+                    for file in sorted(files):
+                        ext = os.path.splitext(file)[1].lower()
+                        if ext not in input_exts:
+                            continue
+
+                        infile = os.path.join(root, file)
+                        rel_root = os.path.relpath(root, masters)
+                        out_dir = os.path.join(derivatives, rel_root)
+                        os.makedirs(out_dir, exist_ok=True)
+
+                        base_name = os.path.splitext(file)[0]
+                        # for PDF/Office, create a subfolder with the filename
+                        if args.input.lower() in ("pdf",) + OFFICE_INPUTS:
+                            doc_out_dir = os.path.join(out_dir, base_name)
+                            os.makedirs(doc_out_dir, exist_ok=True)
+                            outprefix = os.path.join(doc_out_dir, base_name)
+                            # the manifest keeps every page under the document's folder
+                            out_file = doc_out_dir
+                        else:
+                            doc_out_dir = out_dir
+                            outprefix = os.path.join(doc_out_dir, base_name)
+                            out_file = f"{outprefix}.{args.output}"
+
+                        if manifest.up_to_date(out_file, [infile], params):
+                            print(f"Skipping {infile}, up to date.")
+                            continue
+
+                        if args.input.lower() == "pdf":
+                            extract_from_pdf(infile, outprefix, fmt)
+                            manifest.record(out_file, [infile], params, page_images(outprefix, fmt))
+                        elif args.input.lower() in OFFICE_INPUTS:
+                            # converted together once every file is found
+                            office_files.append((infile, outprefix))
+                        elif args.backend == "vips":
+                            pool.submit(timed, f"Converted {infile}", convert_image_vips, infile, out_file, args.resize, args.density, args.monochrome,
+                                done=functools.partial(manifest.record, out_file, [infile], params))
+                        else:
+                            pool.submit(timed, f"Converted {infile}", convert_image, infile, out_file, args.resize, args.density, args.monochrome, limits,
+                                done=functools.partial(manifest.record, out_file, [infile], params))
+                pool.drain()
+
+            if office_files:
+                def extracted(infile, outprefix):
+                    manifest.record(os.path.dirname(outprefix), [infile], params, page_images(outprefix, fmt))
+
+                with scratch_dir(f"convert-{args.package}", os.path.join(package, "tmp_pdf")) as tmp_pdf_dir:
+                    convert_office_files(office_files, tmp_pdf_dir, fmt, workers, done=extracted)
                     try:
                         shutil.rmtree(tmp_pdf_dir)
                         print(f"Temporary directory {tmp_pdf_dir} removed.")
                     except Exception as e:
                         print(f"Warning: could not remove temporary directory {tmp_pdf_dir}: {e}")
-                else:
-                    out_file = f"{outprefix}.{args.output}"
-                    convert_image(infile, out_file, args.resize, args.density, args.monochrome)
 
+    print(manifest.summary())
     print("Complete!")
     print(f"Finished at {datetime.now()}")
 
@@ -0,0 +1,97 @@
+import os
+import json
+import time
+
+MANIFEST_NAME = "derivative_manifest.json"
+# Saved this often during a run as well as at the end, so a killed run keeps most of what it did
+SAVE_INTERVAL = 30
+
+class DerivativeManifest:
+    """Records which sources and conversion parameters each derivative in a package was made from,
+    so a rerun can skip outputs that are already up to date.
+
+    Entries are keyed by output path relative to the package, and a source counts as unchanged
+    if its size and modification time are the same. With force, nothing is up to date, but
+    what's rebuilt is still recorded.
+    """
+
+    def __init__(self, metadataDir, force=False):
+        self.path = os.path.join(metadataDir, MANIFEST_NAME)
+        self.package = os.path.dirname(metadataDir)
+        self.force = force
+        self.entries = {}
+        self.skipped = 0
+        self.rebuilt = 0
+        self.dirty = False
+        self.saved = time.monotonic()
+        if os.path.isfile(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    self.entries = json.load(f).get("outputs", {})
+            except ValueError:
+                print(f"WARNING: Could not read {self.path}, rebuilding every derivative.")
+
+    def rel(self, path):
+        return os.path.relpath(path, self.package)
+
+    def source_state(self, sources):
+        state = {}
+        for source in sources:
+            stat = os.stat(source)
+            state[self.rel(source)] = [stat.st_size, stat.st_mtime_ns]
+        return state
+
+    def up_to_date(self, output, sources, params):
+        """Whether an output was made from these sources, unchanged, with the same parameters and every file it wrote is still there."""
+        if self.force:
+            return False
+        entry = self.entries.get(self.rel(output))
+        if entry is None or entry["params"] != params:
+            return False
+        try:
+            if entry["sources"] != self.source_state(sources):
+                return False
+        except OSError:
+            return False
+        if not all(os.path.exists(os.path.join(self.package, path)) for path in entry["outputs"]):
+            return False
+        self.skipped += 1
+        return True
+
+    def recorded_outputs(self, output):
+        """Every file the last recorded conversion to output wrote."""
+        entry = self.entries.get(self.rel(output), {})
+        return [os.path.normpath(os.path.join(self.package, path)) for path in entry.get("outputs", [])]
+
+    def record(self, output, sources, params, outputs=None):
+        """Record an output that was just made, and any other files the conversion wrote for it."""
+        self.entries[self.rel(output)] = {
+            "sources": self.source_state(sources),
+            "params": params,
+            "outputs": [self.rel(path) for path in (outputs or [output])],
+        }
+        self.rebuilt += 1
+        self.dirty = True
+        if time.monotonic() - self.saved > SAVE_INTERVAL:
+            self.save()
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"outputs": self.entries}, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+        self.dirty = False
+        self.saved = time.monotonic()
+
+    def summary(self):
+        return f"Rebuilt {self.rebuilt} derivatives, skipped {self.skipped} that were up to date."
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # keep what finished before a failure, so a rerun only redoes the rest
+        self.save()
+        return False
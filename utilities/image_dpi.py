@@ -0,0 +1,104 @@
+import io
+import os
+import zlib
+import struct
+from PIL import Image
+from pdf_stream import inherited, resolve
+
+JFIF_APP0 = b"\xff\xe0"
+ADOBE_APP14 = b"\xff\xee"
+INCHES_PER_METER = 39.3701
+
+def page_dpi(page, image):
+    """Resolution of a page's scan, from the image's pixel size and the page's MediaBox in points."""
+    resources = inherited(page, "/Resources")
+    xobjects = (resolve(resources.get("/XObject")) if resources is not None else None) or {}
+    name = "/" + os.path.splitext(image.name)[0]
+    if name in xobjects:
+        xobject = resolve(xobjects.raw_get(name))
+        width, height = int(xobject["/Width"]), int(xobject["/Height"])
+    else:
+        # inline images aren't XObjects, so they have to be decoded for their size
+        width, height = image.image.size
+    box = page.mediabox
+    return round(width * 72 / float(box.width)), round(height * 72 / float(box.height))
+
+def has_adobe_marker(data):
+    """Whether JPEG bytes have an Adobe APP14 segment before the image data."""
+    pos = 2
+    while pos + 4 <= len(data) and data[pos] == 0xFF:
+        marker = data[pos:pos + 2]
+        if marker in (b"\xff\xda", b"\xff\xd9"):
+            break
+        if marker == ADOBE_APP14 and data[pos + 4:pos + 9] == b"Adobe":
+            return True
+        pos += 2 + struct.unpack(">H", data[pos + 2:pos + 4])[0]
+    return False
+
+def set_jpeg_dpi(data, dpi):
+    """Set the JFIF density of JPEG bytes without decoding them.
+
+    Adobe JPEGs without a JFIF segment are left alone, since decoders read a JFIF segment
+    as YCbCr whatever the Adobe segment says, which shifts RGB and CMYK colours. Their
+    resolution has to be given to tesseract and img2pdf instead, see stamped_dpi.
+    """
+    x, y = (min(65535, max(1, int(value))) for value in dpi)
+    if data[:2] != b"\xff\xd8":
+        raise ValueError("Not a JPEG")
+    if data[2:4] == JFIF_APP0 and data[6:11] == b"JFIF\x00":
+        # units (1 is dots per inch), then X and Y density
+        return data[:13] + b"\x01" + struct.pack(">HH", x, y) + data[18:]
+    if has_adobe_marker(data):
+        return data
+    segment = JFIF_APP0 + struct.pack(">H", 16) + b"JFIF\x00\x01\x01\x01" + struct.pack(">HH", x, y) + b"\x00\x00"
+    return data[:2] + segment + data[2:]
+
+def set_png_dpi(data, dpi):
+    """Set the pHYs chunk of PNG bytes without decoding them."""
+    if data[:8] != b"\x89PNG\r\n\x1a\n":
+        raise ValueError("Not a PNG")
+    body = struct.pack(">IIB", round(dpi[0] * INCHES_PER_METER), round(dpi[1] * INCHES_PER_METER), 1)
+    phys = struct.pack(">I", len(body)) + b"pHYs" + body + struct.pack(">I", zlib.crc32(b"pHYs" + body))
+    chunks = [data[:8]]
+    pos = 8
+    while pos < len(data):
+        length = struct.unpack(">I", data[pos:pos + 4])[0]
+        chunk_type = data[pos + 4:pos + 8]
+        end = pos + 12 + length
+        if chunk_type == b"IDAT" and phys:
+            chunks.append(phys)
+            phys = None
+        if chunk_type != b"pHYs":
+            chunks.append(data[pos:end])
+        pos = end
+    return b"".join(chunks)
+
+def set_dpi(data, ext, dpi):
+    """Stamp a resolution on encoded image bytes, rewriting only the header for JPEG and PNG."""
+    ext = ext.lower()
+    if ext in (".jpg", ".jpeg"):
+        return set_jpeg_dpi(data, dpi)
+    if ext == ".png":
+        return set_png_dpi(data, dpi)
+    # other formats, like CCITT pages pypdf gives as TIFF, are saved again with Pillow
+    with Image.open(io.BytesIO(data)) as img:
+        out = io.BytesIO()
+        img.save(out, format=img.format, dpi=dpi)
+        return out.getvalue()
+
+def stamped_dpi(path):
+    """The resolution an image file has in its header, or None."""
+    with Image.open(path) as img:
+        dpi = img.info.get("dpi")
+    return dpi if dpi and all(dpi) else None
+
+def rotate_image(path, rotation, dpi):
+    """Rotate an image file clockwise by a page's /Rotate in one decode and save, keeping its resolution."""
+    rotation = rotation % 360
+    if rotation in (90, 270):
+        dpi = (dpi[1], dpi[0])
+    with Image.open(path) as img:
+        img_format = img.format
+        img_rotate = img.rotate(-rotation, expand=1)
+    img_rotate.save(path, format=img_format, dpi=dpi)
+    return dpi
@@ -4,7 +4,9 @@ import json
 import bagit
 from datetime import datetime
 from listFiles import listFiles
+from stage_timing import stage
 from packages.SIP import SubmissionInformationPackage
+from packages.common import payload_stats
 from id_normalization import normalize_collection_id
 
 #version of ingest.py
@@ -34,9 +36,10 @@ def main(ID, path=None, accession=None):
             
     if accession == None:
         print ("Building SIP...")
-        SIP = SubmissionInformationPackage()
-        SIP.create(ID)
-        SIP.package(path)
+        with stage("build SIP", source=path):
+            SIP = SubmissionInformationPackage()
+            SIP.create(ID)
+            SIP.package(path)
         print ("SIP " + SIP.bagID + " created.")
 
     else:
@@ -81,9 +84,10 @@ def main(ID, path=None, accession=None):
                 description = accessionObject["content_description"]
                 
                 print ("Building SIP...")
-                SIP = SubmissionInformationPackage()
-                SIP.create(ID)
-                SIP.package(path)
+                with stage("build SIP", source=path):
+                    SIP = SubmissionInformationPackage()
+                    SIP.create(ID)
+                    SIP.package(path)
                 print ("SIP " + SIP.bagID + " created.")
                 
                 SIP.bag.info["Accession-Identifier"] = accessionID
@@ -101,15 +105,19 @@ def main(ID, path=None, accession=None):
                                     
         
     print ("Writing checksums...")
-    SIP.bag.save(manifests=True)
+    with stage("bag.save", package=SIP.bagID) as timing:
+        SIP.bag.save(manifests=True)
+        timing.update(payload_stats(SIP.bag))
     print ("SIP Saved!")
     
     # List files in txt for processing
     print ("Listing files for processing...")
-    listFiles(SIP.bagID)
+    with stage("list files", package=SIP.bagID):
+        listFiles(SIP.bagID)
     
     if accession == None:
-        SIP.extentLog("/DigitizationExtentTracker/DigitizationExtentTracker.xlsx")
+        with stage("extent log"):
+            SIP.extentLog("/DigitizationExtentTracker/DigitizationExtentTracker.xlsx")
         print ("Logged ingest to DigitizationExtentTracker.")
     else:
         print ("Updating accession " + accessionID)
@@ -133,7 +141,9 @@ def main(ID, path=None, accession=None):
             accessionObject["extents"] = [extent, extentFiles]
         accessionObject["dates"].append(date)
             
-        updateAccession = client.post(accessionObject["uri"], json=accessionObject)
+        with stage("update accession", accession=accessionID) as timing:
+            updateAccession = client.post(accessionObject["uri"], json=accessionObject)
+            timing["status_code"] = updateAccession.status_code
         if updateAccession.status_code == 200:
             print ("\tSuccessfully updated accession " + accessionID)
         else:
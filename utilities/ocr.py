@@ -1,160 +1,545 @@
 import os, re
+import shutil
 import argparse
+import img2pdf
 from PIL import Image
 from pypdf import PdfReader, PdfWriter
+from pypdf.generic import ArrayObject, IndirectObject
 from datetime import datetime
 from subprocess import Popen, PIPE
 from pathlib import PureWindowsPath, PurePosixPath
+from concurrent.futures import ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
+from stage_timing import stage
+from ocr_journal import OcrJournal, sha256_file
+from ocr_sidecars import sidecar_dir, write_sidecars
+from image_dpi import page_dpi, set_dpi, rotate_image, stamped_dpi
+from scratch import scratch_dir
+from pdf_stream import StreamingPdfWriter, inherited, resolve
 
 processingDir = "/backlog"
+# Pages OCRed at once. Each tesseract is limited to one thread, so this is about how many cores OCR uses.
+OCR_WORKERS = int(os.getenv("PROCESSING_OCR_WORKERS", os.cpu_count() or 1))
+MERGE_MODES = ("stream", "writer")
+# Pages are blank if less than this share of their pixels, outside the margins, are darker than INK_LEVEL
+BLANK_THRESHOLD = 0.001
+BLANK_MARGIN = 0.05
+INK_LEVEL = 128
+# Text showing operators, Tj and TJ, or ' and " after a string operand
+TEXT_OPERATORS = re.compile(rb"(?<![A-Za-z0-9_])T[jJ](?![A-Za-z0-9_])|[)>]\s*['\"]")
 
-parser = argparse.ArgumentParser()
-parser.add_argument("package", help="ID for package you are processing, i.e. 'ua950.012_Xf5xzeim7n4yE6tjKKHqLM'.")
-parser.add_argument("-p", "--path", help="Subpath, relative to derivatives directory which will only convert files there.", default=None)
-
-args = parser.parse_args()
-
-if "_" in args.package:
-    ID = args.package.split("_")[0]
-elif "-" in args.package:
-    ID = args.package.split("-")[0]
-else:
-    raise Exception("ERROR: " + str(args.package) + " is not a valid processing package.")
-    
-package = os.path.join(processingDir, ID, args.package)
-masters = os.path.join(package, "masters")
-derivatives = os.path.join(package, "derivatives")
-metadata = os.path.join(package, "metadata")
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("package", help="ID for package you are processing, i.e. 'ua950.012_Xf5xzeim7n4yE6tjKKHqLM'.")
+    parser.add_argument("-p", "--path", help="Subpath, relative to derivatives directory which will only convert files there.", default=None)
+    parser.add_argument("-w", "--workers", type=int, default=OCR_WORKERS, help="Number of pages to OCR at once. Use 1 to OCR one page at a time.")
+    parser.add_argument("-s", "--single-pass", action="store_true", help="OCR all of a PDF's pages with one tesseract, and keep its hOCR and text in metadata/ocr for upload to reuse.")
+    parser.add_argument("-b", "--skip-blank", action="store_true", help="Add pages with almost no ink to the PDF as images without running tesseract on them. Not used with --single-pass.")
+    parser.add_argument("--blank-threshold", type=float, default=BLANK_THRESHOLD, help=f"Share of a page's pixels that have to be ink for it not to be blank, {BLANK_THRESHOLD} by default.")
+    parser.add_argument("-m", "--merge", choices=MERGE_MODES, default="stream", help="How page PDFs are merged. 'stream' writes each page as it's read so memory stays flat, 'writer' builds the whole PDF in memory with pypdf's PdfWriter.")
+    return parser.parse_args()
 
 def process(cmd):
-    #p = Popen(cmd, shell=True, stdout=PIPE, stderr=PIPE)
+    """Run a command and return its exit code and any output."""
     p = Popen(cmd, stdout=PIPE, stderr=PIPE)
     stdout, stderr = p.communicate()
+    output = []
     if len(stdout) > 0:
-        print (stdout.decode())
+        output.append(stdout.decode())
     if len(stderr) > 0:
-        print (stderr.decode())
-    return p.returncode
-    
-if args.path:
-    if "\\" in args.path:
-        winPath = PureWindowsPath(args.path)
-        ocrPath = str(PurePosixPath(derivatives, *winPath.parts))
+        output.append(stderr.decode())
+    return p.returncode, output
+
+def init_worker():
+    # tesseract otherwise starts a thread per core for each page
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+def prepare_page(filepath, image_path, dpi, page_rotation, page_count, output):
+    """Apply a page's rotation to its extracted image, which already has its resolution. Returns an error message if it fails."""
+    output.append(f"\tRestored to {dpi[0]}x{dpi[1]} dpi...")
+
+    #address image rotation
+    if page_rotation:
+        output.append("\tFixing image rotation...")
+        try:
+            with stage("rotate page", file=filepath, page=page_count, rotation=page_rotation):
+                rotate_image(image_path, page_rotation, dpi)
+        except OSError as e:
+            return f'Error rotating file {image_path}, {e}'
+    return None
+
+def ink_ratio(image_path, margin=BLANK_MARGIN):
+    """Share of a page image's pixels dark enough to be ink, leaving out the margins where scanner shadows fall."""
+    with Image.open(image_path) as img:
+        # at full resolution, since scaling down averages thin strokes like pencil notes into the paper
+        gray = img.convert("L")
+    width, height = gray.size
+    dx, dy = int(width * margin), int(height * margin)
+    histogram = gray.crop((dx, dy, width - dx, height - dy)).histogram()
+    total = sum(histogram)
+    return sum(histogram[:INK_LEVEL]) / total if total else 0.0
+
+def ocr_page(filepath, image_path, page_file, dpi, page_rotation, page_count, page_total, blank_threshold=None):
+    """Restore an extracted page image's rotation, then OCR it to a one page PDF.
+
+    Runs in a pool worker, so it returns its output to be printed in page order, an error
+    message if a step failed, and whether the page was blank and added without OCR.
+    """
+    output = []
+    error = prepare_page(filepath, image_path, dpi, page_rotation, page_count, output)
+    if error:
+        return output, error, False
+
+    # pages that couldn't have their resolution stamped, like Adobe JPEGs, get it on the command line
+    missing_dpi = stamped_dpi(image_path) is None
+    if blank_threshold is not None:
+        with stage("blank check", file=filepath, page=page_count) as timing:
+            ratio = ink_ratio(image_path)
+            timing["ink"] = round(ratio, 6)
+        if ratio < blank_threshold:
+            output.append(f"\t--> page {page_count} of {page_total} is blank ({ratio:.3%} ink), adding it without OCR...")
+            try:
+                layout = img2pdf.get_fixed_dpi_layout_fun(dpi) if missing_dpi else img2pdf.default_layout_fun
+                with open(page_file + ".pdf", "wb") as f:
+                    f.write(img2pdf.convert(image_path, layout_fun=layout))
+                os.remove(image_path)
+                return output, None, True
+            except Exception as e:
+                output.append(f"\tCould not add blank page as an image, OCRing it instead. {e}")
+
+    cmd = ["tesseract", image_path, page_file]
+    if missing_dpi:
+        cmd += ["--dpi", str(dpi[0])]
+    cmd.append("pdf")
+    output.append(f"\t--> reading page {page_count} of {page_total}, {image_path}...")
+    with stage("OCR page", file=filepath, page=page_count, bytes=os.path.getsize(image_path)) as timing:
+        resp, tesseract_output = process(cmd)
+        timing["returncode"] = resp
+    output.extend(tesseract_output)
+    if resp != 0:
+        return output, f'Error processing file {os.path.basename(filepath)}', False
+    # delete temporary image
+    os.remove(image_path)
+    return output, None, False
+
+def prepare_only(filepath, image_path, page_file, dpi, page_rotation, page_count, page_total):
+    """Pool worker for single pass mode, where pages are only prepared for ocr_document."""
+    output = []
+    error = prepare_page(filepath, image_path, dpi, page_rotation, page_count, output)
+    return output, error, False
+
+def ocr_document(filepath, image_paths, outbase, dpis=None):
+    """OCR all of a PDF's page images with one tesseract, writing a searchable PDF, hOCR and text."""
+    output = [f"\t--> reading all {len(image_paths)} pages of {filepath} in one pass..."]
+    list_path = outbase + "-pages.txt"
+    with open(list_path, "w") as f:
+        f.write("\n".join(image_paths) + "\n")
+    cmd = ["tesseract", list_path, outbase]
+    if dpis and any(stamped_dpi(image_path) is None for image_path in image_paths):
+        # tesseract's --dpi is for every page, so it's only safe when they were all scanned alike
+        if len(set(dpi[0] for dpi in dpis)) == 1:
+            cmd += ["--dpi", str(dpis[0][0])]
+        else:
+            output.append(f"\tWARNING: Some pages of {filepath} have no resolution and the pages differ, so they may be sized wrong in the PDF.")
+    cmd += ["pdf", "hocr", "txt"]
+    with stage("OCR document", file=filepath, pages=len(image_paths)) as timing:
+        resp, tesseract_output = process(cmd)
+        timing["returncode"] = resp
+    output.extend(tesseract_output)
+    if resp != 0:
+        return output, f'Error processing file {os.path.basename(filepath)}'
+    os.remove(list_path)
+    for image_path in image_paths:
+        os.remove(image_path)
+    return output, None
+
+class OcrFile:
+    """One PDF's pages in the OCR pool, merged back into the PDF once every page is done,
+    or in single pass mode, OCRed together once every page is ready."""
+
+    def __init__(self, filepath, rel, workDir, journal, single_pass=False):
+        self.filepath = filepath
+        self.rel = rel
+        # pages go in their own folder so files with the same name in different subfolders don't collide
+        self.workDir = workDir
+        self.journal = journal
+        self.single_pass = single_pass
+        self.pageOrder = []
+        self.images = []
+        self.dpis = []
+        self.futures = []
+        self.document = None
+        self.resumed = set()
+        self.reported = 0
+        self.blank = 0
+        self.extracted = False
+
+    def running(self):
+        running = [future for future in self.futures[self.reported:] if not future.done()]
+        if self.document and not self.document.done():
+            running.append(self.document)
+        return running
+
+    def pending(self):
+        return len(self.running())
+
+    def report_pages(self):
+        """Print the output of finished pages in page order, and stop on the first failed page."""
+        while self.reported < len(self.futures) and self.futures[self.reported].done():
+            output, error, blank = self.futures[self.reported].result()
+            for line in output:
+                print (line)
+            if error:
+                raise ValueError(error)
+            self.blank += blank
+            if not self.reported in self.resumed and not self.single_pass:
+                self.journal.page(self.rel, self.reported + 1, self.pageOrder[self.reported], self.workDir)
+            self.reported += 1
+        return self.extracted and self.reported == len(self.futures)
+
+    def merge(self, convertDir, merge_mode="stream"):
+        root, file = os.path.split(self.filepath)
+        print (f"Merging back to {self.filepath}...")
+        os.rename(self.filepath, os.path.join(root, "." + file))
+        with stage("merge", file=self.filepath, pages=len(self.pageOrder), mode=merge_mode) as timing:
+            merge_pages(self.pageOrder, self.filepath, merge_mode)
+            timing["bytes"] = os.path.getsize(self.filepath)
+        if os.path.isfile(self.filepath) and os.stat(self.filepath).st_size:
+            self.journal.merge(self.rel, self.filepath)
+            os.remove(os.path.join(root, "." + file))
+            # delete temporary pdf
+            for pdf_page in self.pageOrder:
+                os.remove(pdf_page)
+            remove_empty_dirs(self.workDir, convertDir)
+
+    def finish_document(self, convertDir, metadataDir):
+        """Replace the PDF with the one tesseract made in a single pass, and keep its hOCR and text."""
+        output, error = self.document.result()
+        for line in output:
+            print (line)
+        if error:
+            raise ValueError(error)
+
+        root, file = os.path.split(self.filepath)
+        stem = os.path.splitext(file)[0]
+        outbase = os.path.join(self.workDir, stem)
+        dest = sidecar_dir(metadataDir, self.rel)
+        print (f"Writing hOCR and text for each page to {dest}...")
+        with stage("hOCR sidecars", file=self.filepath, pages=len(self.images)):
+            write_sidecars(outbase, dest, stem, len(self.images))
+
+        print (f"Replacing {self.filepath} with OCRed PDF...")
+        # the scratch directory can be on another filesystem, so move the PDF next to the
+        # original before setting the original aside, then rename it into place
+        staged = os.path.join(root, "." + file + ".part")
+        shutil.move(outbase + ".pdf", staged)
+        os.rename(self.filepath, os.path.join(root, "." + file))
+        os.replace(staged, self.filepath)
+        if os.path.isfile(self.filepath) and os.stat(self.filepath).st_size:
+            self.journal.merge(self.rel, self.filepath)
+            os.remove(os.path.join(root, "." + file))
+            remove_empty_dirs(self.workDir, convertDir)
+
+def merge_pages(page_files, outfile, merge_mode="stream"):
+    """Combine one page PDFs into one PDF."""
+    if merge_mode == "stream":
+        with StreamingPdfWriter(outfile) as merger:
+            for pdf_page in page_files:
+                merger.append(pdf_page)
     else:
-        ocrPath = os.path.join(derivatives, os.path.normpath(args.path))
-    if not os.path.isdir(derivatives):
-        raise Exception("ERROR: subpath " + args.path + " relative to derivatives is not a valid path.")
-else:
-    ocrPath = derivatives
-
-# Check if there are any files
-fileTotal = 0
-for root, dirs, files in os.walk(ocrPath):
-    for file in files:
-        if file.lower().endswith(".pdf"):
-            fileTotal += 1
-if fileTotal == 0:
-    raise ValueError(f"Error: No PDF files found in derivatives folder in package {args.package}")
-
-# Set up temp folder to extract images to
-convertDir = os.path.join(package, "converting-ocr")
-if not os.path.isdir(convertDir):
-    os.mkdir(convertDir)
-
-fileCount = 0
-for root, dirs, files in os.walk(ocrPath):
-    for file in files:
-        if file.lower().endswith(".pdf"):
-            fileCount += 1
+        merger = PdfWriter()
+        for pdf_page in page_files:
+            merger.append(pdf_page)
+        merger.write(outfile)
+        merger.close()
+
+def remove_empty_dirs(path, stop):
+    """Remove a file's page folder and any parents left empty, up to the converting directory."""
+    while os.path.abspath(path) != os.path.abspath(stop) and os.path.isdir(path) and len(os.listdir(path)) == 0:
+        os.rmdir(path)
+        path = os.path.dirname(path)
+
+class PagePool:
+    """Every page of every PDF in one pool of workers.
+
+    A file's pages are submitted as soon as they're extracted, whatever file they're from,
+    and a file is merged as soon as its last page is done, so a folder of many short PDFs
+    keeps every worker as busy as one long one. Extraction only runs a couple of pages per
+    worker ahead, so the converting directory stays small.
+    """
+
+    def __init__(self, executor, convertDir, metadataDir, max_pending, merge_mode="stream", blank_threshold=None):
+        self.executor = executor
+        self.convertDir = convertDir
+        self.metadataDir = metadataDir
+        self.max_pending = max_pending
+        self.merge_mode = merge_mode
+        self.blank_threshold = blank_threshold
+        self.blank = 0
+        self.files = []
+
+    def pending(self):
+        return sum(ocr_file.pending() for ocr_file in self.files)
+
+    def finish_ready(self):
+        for ocr_file in list(self.files):
+            if not ocr_file.report_pages():
+                continue
+            if not ocr_file.single_pass:
+                if ocr_file.blank:
+                    print (f"Added {ocr_file.blank} blank pages of {os.path.basename(ocr_file.filepath)} without OCR.")
+                    self.blank += ocr_file.blank
+                ocr_file.merge(self.convertDir, self.merge_mode)
+                self.files.remove(ocr_file)
+            elif ocr_file.document is None:
+                # every page is ready, so OCR them all in one go
+                outbase = os.path.join(ocr_file.workDir, os.path.splitext(os.path.basename(ocr_file.filepath))[0])
+                ocr_file.document = self.executor.submit(ocr_document, ocr_file.filepath, ocr_file.images, outbase, ocr_file.dpis)
+            elif ocr_file.document.done():
+                ocr_file.finish_document(self.convertDir, self.metadataDir)
+                self.files.remove(ocr_file)
+
+    def wait_for_pages(self, limit):
+        while self.pending() >= limit:
+            running = [future for ocr_file in self.files for future in ocr_file.running()]
+            wait(running, return_when=FIRST_COMPLETED)
+            self.finish_ready()
+        self.finish_ready()
+
+    def submit(self, ocr_file, *args):
+        self.wait_for_pages(self.max_pending)
+        if ocr_file.single_pass:
+            future = self.executor.submit(prepare_only, ocr_file.filepath, *args)
+        else:
+            future = self.executor.submit(ocr_page, ocr_file.filepath, *args, blank_threshold=self.blank_threshold)
+        ocr_file.futures.append(future)
+
+    def resume(self, ocr_file):
+        """Add a page a previous run already OCRed."""
+        done = Future()
+        done.set_result(([], None, False))
+        ocr_file.resumed.add(len(ocr_file.futures))
+        ocr_file.futures.append(done)
+
+    def drain(self):
+        """Wait until every file is merged, or in single pass mode, OCRed and replaced. A single pass
+        document is only submitted once its last page is ready, so there can be nothing running
+        while a file is still waiting for it."""
+        while self.files:
+            running = [future for ocr_file in self.files for future in ocr_file.running()]
+            if running:
+                wait(running, return_when=FIRST_COMPLETED)
+            self.finish_ready()
+
+def recover_file(filepath, rel, journal):
+    """Clean up after a run that stopped while merging this file. Returns True if the file is already done."""
+    root, file = os.path.split(filepath)
+    backup = os.path.join(root, "." + file)
+    staged = backup + ".part"
+    merged = journal.merged(rel)
+    if os.path.isfile(staged):
+        print (f"Removing {staged} left by an interrupted single pass.")
+        os.remove(staged)
+    if os.path.isfile(backup):
+        if merged and os.path.isfile(filepath) and sha256_file(filepath) == merged:
+            print (f"Removing backup {backup} left after {file} was merged.")
+            os.remove(backup)
+        else:
+            print (f"Restoring {file} from backup {backup} left by an interrupted merge.")
+            os.replace(backup, filepath)
+    if merged and sha256_file(filepath) == merged:
+        print (f"Skipping {file}, already OCRed according to {journal.path}.")
+        return True
+    return False
+
+def content_data(page):
+    contents = resolve(page.get("/Contents"))
+    if contents is None:
+        return b""
+    if isinstance(contents, ArrayObject):
+        return b"\n".join(resolve(part).get_data() for part in contents)
+    return contents.get_data()
+
+def scan_page(page):
+    """Count a page's images and check whether it shows any text, without extracting it.
+
+    Text needs a font, so content streams are only read for a page or form XObject that has
+    font resources, and then only searched for text showing operators.
+    """
+    images = 0
+    has_text = False
+    seen = set()
+    stack = [(inherited(page, "/Resources"), lambda: content_data(page))]
+    while stack:
+        resources, data = stack.pop()
+        if resources is None:
+            continue
+        if not has_text and resolve(resources.get("/Font")) and TEXT_OPERATORS.search(data()):
+            has_text = True
+        for ref in (resolve(resources.get("/XObject")) or {}).values():
+            key = (ref.idnum, ref.generation) if isinstance(ref, IndirectObject) else id(ref)
+            if key in seen:
+                continue
+            seen.add(key)
+            xobject = ref.get_object()
+            if xobject.get("/Subtype") == "/Image":
+                images += 1
+            elif xobject.get("/Subtype") == "/Form":
+                stack.append((resolve(xobject.get("/Resources")), xobject.get_data))
+    return images, has_text
+
+def prescan(ocrPath, derivatives, journal):
+    """List the PDFs to OCR with their page and image counts, before any OCR starts.
+
+    Files that were already OCRed according to the journal are recovered and marked done, and
+    a file stops being scanned at its first page with text, since it won't be OCRed.
+    """
+    pdfs = []
+    for root, dirs, files in os.walk(ocrPath):
+        # skip backups of PDFs that were being merged
+        names = [file for file in files if file.lower().endswith(".pdf") and not file.startswith(".")]
+        # but a backup without its PDF was left by a run that stopped before the new one was written,
+        # and recover_file puts it back. ._ files are macOS metadata, not backups.
+        names += [
+            file[1:] for file in files
+            if file.lower().endswith(".pdf") and file.startswith(".") and not file.startswith("._") and not file[1:] in files
+        ]
+        for file in names:
             filepath = os.path.join(root, file)
-            print (f"Processing {file} (file {fileCount} of {fileTotal})...")
-
-            # Getting DPI for each image
-            pageDPI = {}
-            pdfimagesCmd = ["pdfimages", "-list", filepath]
-            pdfimages = Popen(pdfimagesCmd, stdout=PIPE, stderr=PIPE)
-            lineCount = -2
-            for line in pdfimages.stdout:
-                lineCount += 1
-                if lineCount > 0:
-                    col = re.split("\\s+", line.decode().strip())
-                    pageDPI[lineCount] = f"{col[12]}x{col[13]}"
-
-            # convert to images
-            pageOrder = []
-            pdf_reader = PdfReader(filepath)
-            page_count = 0
-            page_total = len(pdf_reader.pages)
-
-            # check if PDF already has embeded text
-            embeded_text = False
-            for page in pdf_reader.pages:
-                if len(page.extract_text().strip()) > 0:
-                    embeded_text = True
-                    print (f"WARNING: Ignoring {file} as it already contains embeded text.")
-            if embeded_text == False:
-
-                # Extract page images to converting directory and OCR with tesseract
-                for page in pdf_reader.pages:
-                    page_count += 1
-                    if len(page.images) != 1:
-                        raise ValueError(f"ERROR: During OCR prep, PDF page number {page_count} has multiple images.")
-                    page_rotation = page.get('/Rotate')
-                    for image in page.images:
-                        ext = os.path.splitext(image.name)[1]
-                        image_path = os.path.join(convertDir, f"{os.path.splitext(file)[0]}-{page_count}{ext}")
-                        if os.path.isfile(image_path):
-                            raise ValueError(f"ERROR: In extracting images for OCR, file already exists: {image_path}.")
-                        with open(image_path, "wb") as fp:
-                            fp.write(image.data)
-
-                        # fix sizing
-                        print (f"\tRestoring to {pageDPI[page_count]} dpi...")
-                        size_cmd = ['convert', '-units', 'pixelsperinch', '-density', pageDPI[page_count], image_path, image_path]
-                        if ext.lower() == "png":
-                            size_cmd.insert(1, '-units pixelsperinch')
-                        #print (f"\trunning {' '.join(size_cmd)}")
-                        size_resp = process(size_cmd)
-                        if size_resp != 0:
-                            raise ValueError(f'Error resizing file {image_path}')
-
-                        #address image rotation
-                        if page_rotation:
-                            print ("\tFixing image rotation...")
-                            img = Image.open(image_path)
-                            img_rotate = img.rotate(-abs(page_rotation), expand=1)
-                            img_rotate.save(image_path)
-
-                        page_file = os.path.join(convertDir, f"{os.path.splitext(file)[0]}-{page_count}")
-                        pageOrder.append(page_file + ".pdf")
-                        cmd = ["tesseract", image_path, page_file, "pdf"]
-                        print (f"\t--> reading page {page_count} of {page_total}, {image_path}...")
-                        resp = process(cmd)
-                        if resp != 0:
-                            raise ValueError(f'Error processing file {file}')
-                        # delete temporary image
-                        os.remove(image_path)
-
-                # Merge back to single PDF
-                print (f"Merging back to {file}...")
-                os.rename(filepath, os.path.join(root, "." + file))
-                merger = PdfWriter()
-                for pdf_page in pageOrder:
-                    merger.append(pdf_page)
-                merger.write(filepath)
-                merger.close()
-                if os.path.isfile(filepath) and os.stat(filepath).st_size:
-                    os.remove(os.path.join(root, "." + file))
-                    # delete temporary pdf
-                    for pdf_page in pageOrder:
-                        os.remove(pdf_page) 
-
-print ("Cleaning temporary directory...")
-if len(os.listdir(convertDir)) == 0:
-    os.rmdir(convertDir)
-else:
-    raise ValueError(f"ERROR: temporary directory {convertDir} is not empty, cannot cleanup.")
-
-
-print ("Complete!")
-print (f"Finished at {datetime.now()}")
+            pdf = {"path": filepath, "rel": os.path.relpath(filepath, derivatives), "pages": 0, "images": 0, "text_page": None, "done": False}
+            pdfs.append(pdf)
+            if recover_file(filepath, pdf["rel"], journal):
+                pdf["done"] = True
+                continue
+            pdf["size"] = os.path.getsize(filepath)
+            with stage("text check", file=filepath) as timing:
+                pdf_reader = PdfReader(filepath)
+                pdf["pages"] = len(pdf_reader.pages)
+                for page_count, page in enumerate(pdf_reader.pages, 1):
+                    images, has_text = scan_page(page)
+                    pdf["images"] += images
+                    if has_text:
+                        pdf["text_page"] = page_count
+                        print (f"WARNING: Ignoring {file} as it already contains embeded text, starting on page {page_count}.")
+                        break
+                timing.update(pages=pdf["pages"], images=pdf["images"], text_page=pdf["text_page"])
+    return pdfs
+
+def add_file(pool, filepath, rel, workDir, journal, single_pass=False):
+    """Queue OCR for each page of a PDF that isn't already done."""
+    root, file = os.path.split(filepath)
+    pdf_reader = PdfReader(filepath)
+    page_total = len(pdf_reader.pages)
+
+    # Pages are only reused if they were OCRed from this exact PDF
+    journal.start(rel, sha256_file(filepath))
+    # a single pass has no page PDFs to pick up from
+    finished = set() if single_pass else journal.finished_pages(rel, workDir)
+    if finished:
+        print (f"Resuming {file}, {len(finished)} of {page_total} pages already OCRed.")
+
+    # Extract page images to converting directory and OCR them in the pool
+    os.makedirs(workDir, exist_ok=True)
+    ocr_file = OcrFile(filepath, rel, workDir, journal, single_pass)
+    pool.files.append(ocr_file)
+    page_count = 0
+    for page in pdf_reader.pages:
+        page_count += 1
+        if len(page.images) != 1:
+            raise ValueError(f"ERROR: During OCR prep, PDF page number {page_count} has multiple images.")
+        page_file = os.path.join(workDir, f"{os.path.splitext(file)[0]}-{page_count}")
+        ocr_file.pageOrder.append(page_file + ".pdf")
+        if page_count in finished:
+            pool.resume(ocr_file)
+            continue
+        page_rotation = page.get('/Rotate')
+        for image in page.images:
+            ext = os.path.splitext(image.name)[1]
+            # overwrites an image left by an interrupted run
+            image_path = os.path.join(workDir, f"{os.path.splitext(file)[0]}-{page_count}{ext}")
+            # the resolution goes in the image header as it's written, so only rotated pages are encoded again
+            dpi = page_dpi(page, image)
+            with stage("restore DPI", file=filepath, page=page_count):
+                data = set_dpi(image.data, ext, dpi)
+            with open(image_path, "wb") as fp:
+                fp.write(data)
+
+            ocr_file.images.append(image_path)
+            ocr_file.dpis.append(dpi)
+            pool.submit(ocr_file, image_path, page_file, dpi, page_rotation, page_count, page_total)
+    ocr_file.extracted = True
+    pool.finish_ready()
+
+def main():
+    args = parse_args()
+
+    if "_" in args.package:
+        ID = args.package.split("_")[0]
+    elif "-" in args.package:
+        ID = args.package.split("-")[0]
+    else:
+        raise Exception("ERROR: " + str(args.package) + " is not a valid processing package.")
+        
+    package = os.path.join(processingDir, ID, args.package)
+    derivatives = os.path.join(package, "derivatives")
+    metadata = os.path.join(package, "metadata")
+
+    if args.path:
+        if "\\" in args.path:
+            winPath = PureWindowsPath(args.path)
+            ocrPath = str(PurePosixPath(derivatives, *winPath.parts))
+        else:
+            ocrPath = os.path.join(derivatives, os.path.normpath(args.path))
+        if not os.path.isdir(derivatives):
+            raise Exception("ERROR: subpath " + args.path + " relative to derivatives is not a valid path.")
+    else:
+        ocrPath = derivatives
+
+    journal = OcrJournal(metadata)
+
+    # Check if there are any files
+    pdfs = prescan(ocrPath, derivatives, journal)
+    if len(pdfs) == 0:
+        raise ValueError(f"Error: No PDF files found in derivatives folder in package {args.package}")
+    to_ocr = [pdf for pdf in pdfs if not pdf["done"] and pdf["text_page"] is None]
+    fileTotal = len(to_ocr)
+    print (f"Found {len(pdfs)} PDFs. {fileTotal} to OCR with {sum(pdf['pages'] for pdf in to_ocr)} pages and {sum(pdf['images'] for pdf in to_ocr)} images, "
+        f"{sum(pdf['done'] for pdf in pdfs)} already OCRed, {len(pdfs) - fileTotal - sum(pdf['done'] for pdf in pdfs)} with embeded text.")
+    largest = max([pdf["size"] for pdf in to_ocr], default=0)
+
+    workers = max(1, args.workers)
+    print (f"OCRing up to {workers} pages at once.")
+    fileCount = 0
+    # Set up temp folder to extract images to, with room for a file's images and page PDFs
+    with scratch_dir(f"ocr-{args.package}", os.path.join(package, "converting-ocr"), needed=largest * 2) as convertDir:
+        print (f"Extracting page images to {convertDir}")
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+            pool = PagePool(executor, convertDir, metadata, workers * 2, args.merge, args.blank_threshold if args.skip_blank else None)
+            for pdf in pdfs:
+                workDir = os.path.join(convertDir, os.path.splitext(pdf["rel"])[0])
+                if pdf["done"]:
+                    # pages left by a run that stopped after merging
+                    if os.path.isdir(workDir):
+                        shutil.rmtree(workDir)
+                    continue
+                if pdf["text_page"] is not None:
+                    continue
+                fileCount += 1
+                print (f"Processing {os.path.basename(pdf['path'])} (file {fileCount} of {fileTotal})...")
+                add_file(pool, pdf["path"], pdf["rel"], workDir, journal, args.single_pass)
+            pool.drain()
+        if args.skip_blank and not args.single_pass:
+            print (f"Skipped OCR on {pool.blank} blank pages.")
+        journal.compact()
+
+        print ("Cleaning temporary directory...")
+        if len(os.listdir(convertDir)) == 0:
+            os.rmdir(convertDir)
+        else:
+            raise ValueError(f"ERROR: temporary directory {convertDir} is not empty, cannot cleanup.")
+
+
+    print ("Complete!")
+    print (f"Finished at {datetime.now()}")
+
+if __name__ == "__main__":
+    main()
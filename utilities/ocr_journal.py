@@ -0,0 +1,92 @@
+import os
+import json
+import hashlib
+from datetime import datetime
+
+JOURNAL_NAME = "ocr_journal.jsonl"
+BUF_SIZE = 1024 * 1024
+
+def sha256_file(path):
+    fileHash = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(BUF_SIZE)
+            if not data:
+                break
+            fileHash.update(data)
+    return fileHash.hexdigest()
+
+class OcrJournal:
+    """Records each OCRed page and each merged PDF in a package, so a rerun can pick up where an earlier run stopped.
+
+    Entries are JSON lines in the package's metadata folder. Files are keyed by their path
+    relative to derivatives, and pages are only reused if both the source PDF and the page
+    PDF still have the hashes that were recorded.
+    """
+
+    def __init__(self, metadataDir):
+        self.path = os.path.join(metadataDir, JOURNAL_NAME)
+        self.files = {}
+        if os.path.isfile(self.path):
+            with open(self.path, "r") as f:
+                for line in f:
+                    try:
+                        self.apply(json.loads(line))
+                    except (ValueError, KeyError):
+                        # a partial line from a run that was killed mid-write
+                        continue
+
+    def state(self, file):
+        return self.files.setdefault(file, {"source": None, "pages": {}, "merged": None})
+
+    def apply(self, entry):
+        state = self.state(entry["file"])
+        if entry["event"] == "start":
+            if state["source"] != entry["source"]:
+                state["pages"] = {}
+            state["source"] = entry["source"]
+        elif entry["event"] == "page":
+            state["pages"][entry["page"]] = (entry["pdf"], entry["sha256"])
+        elif entry["event"] == "merged":
+            state["pages"] = {}
+            state["source"] = None
+            state["merged"] = entry["sha256"]
+
+    def record(self, event, file, **fields):
+        entry = {"time": datetime.now().isoformat(timespec="seconds"), "event": event, "file": file, **fields}
+        with open(self.path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.apply(entry)
+
+    def merged(self, file):
+        return self.state(file)["merged"]
+
+    def start(self, file, source):
+        if self.state(file)["source"] != source:
+            self.record("start", file, source=source)
+
+    def page(self, file, page, pdf, workDir):
+        self.record("page", file, page=page, pdf=os.path.relpath(pdf, workDir), sha256=sha256_file(pdf))
+
+    def finished_pages(self, file, workDir):
+        """Page numbers already OCRed for a file whose page PDFs are still intact."""
+        finished = set()
+        for page, (pdf, digest) in self.state(file)["pages"].items():
+            pdf = os.path.join(workDir, pdf)
+            if os.path.isfile(pdf) and sha256_file(pdf) == digest:
+                finished.add(page)
+        return finished
+
+    def merge(self, file, filepath):
+        self.record("merged", file, sha256=sha256_file(filepath))
+
+    def compact(self):
+        """Once a run finishes, only keep what's needed to skip merged files next time."""
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            for file, state in self.files.items():
+                if state["merged"]:
+                    f.write(json.dumps({"event": "merged", "file": file, "sha256": state["merged"]}) + "\n")
+        os.replace(tmp, self.path)
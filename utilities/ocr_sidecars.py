@@ -0,0 +1,125 @@
+import os
+import re
+import yaml
+from PIL import Image
+
+# hOCR and text from ocr.py's single pass, kept in the package's metadata folder under
+# the path of the page images pdftoppm makes from the same PDF, so upload can reuse them
+SIDECAR_DIR = "ocr"
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".tif")
+
+PAGE_START = re.compile(r"<div class=['\"]ocr_page['\"]")
+PAGE_SIZE = re.compile(r"class=['\"]ocr_page['\"][^>]*?bbox 0 0 (\d+) (\d+)")
+BBOX = re.compile(r"bbox (\d+) (\d+) (\d+) (\d+)")
+FONT_SIZES = re.compile(r"(x_size|x_descenders|x_ascenders) ([\d.]+)")
+BASELINE = re.compile(r"baseline ([-\d.]+) ([-\d.]+)")
+
+def page_name(stem, page, page_total):
+    """Name pdftoppm gives a page image, e.g. letter-07 for page 7 of 12."""
+    return f"{stem}-{page:0{len(str(page_total))}d}"
+
+def sidecar_dir(metadataDir, rel):
+    """Folder for the sidecars of a PDF at rel, relative to derivatives."""
+    return os.path.join(metadataDir, SIDECAR_DIR, os.path.splitext(rel)[0])
+
+def split_hocr(hocr):
+    """Split tesseract's hOCR for a list of images into one document per page."""
+    starts = [match.start() for match in PAGE_START.finditer(hocr)]
+    if not starts:
+        return []
+    end = hocr.rfind("</body>")
+    header = hocr[:starts[0]]
+    footer = hocr[end:]
+    pages = []
+    for i, start in enumerate(starts):
+        stop = starts[i + 1] if i + 1 < len(starts) else end
+        pages.append(header + hocr[start:stop].rstrip() + "\n " + footer)
+    return pages
+
+def write_sidecars(outbase, dest, stem, page_total):
+    """Split tesseract's outbase.hocr and outbase.txt into per-page sidecars in dest."""
+    with open(outbase + ".hocr", "r", encoding="utf-8") as f:
+        pages = split_hocr(f.read())
+    with open(outbase + ".txt", "r", encoding="utf-8") as f:
+        # tesseract ends each page's text with a form feed
+        texts = f.read().split("\f")
+    if len(pages) != page_total:
+        raise ValueError(f"ERROR: tesseract returned hOCR for {len(pages)} of {page_total} pages of {stem}.")
+
+    os.makedirs(dest, exist_ok=True)
+    for page, hocr in enumerate(pages, 1):
+        name = page_name(stem, page, page_total)
+        with open(os.path.join(dest, name + ".hocr"), "w", encoding="utf-8") as f:
+            f.write(hocr)
+        with open(os.path.join(dest, name + ".txt"), "w", encoding="utf-8") as f:
+            f.write(texts[page - 1] if page - 1 < len(texts) else "")
+    os.remove(outbase + ".hocr")
+    os.remove(outbase + ".txt")
+
+def scale_hocr(hocr, width, height):
+    """Scale hOCR coordinates from the image tesseract read to an image of another size."""
+    size = PAGE_SIZE.search(hocr)
+    if not size:
+        return hocr
+    sx = width / int(size.group(1))
+    sy = height / int(size.group(2))
+    if sx == 1 and sy == 1:
+        return hocr
+    hocr = BBOX.sub(lambda m: f"bbox {round(int(m[1]) * sx)} {round(int(m[2]) * sy)} {round(int(m[3]) * sx)} {round(int(m[4]) * sy)}", hocr)
+    hocr = FONT_SIZES.sub(lambda m: f"{m[1]} {float(m[2]) * sy:g}", hocr)
+    return BASELINE.sub(lambda m: f"baseline {m[1]} {round(float(m[2]) * sy)}", hocr)
+
+def import_sidecars(object_path, derivatives, metadataDir, access_files):
+    """Use the sidecars from ocr.py as an object's hOCR, text and content.txt instead of running create_hocr.
+
+    Only does anything if every image being uploaded has sidecars, so an object is
+    never half from one OCR run and half from another. Returns whether it did.
+    """
+    metadata_path = os.path.join(object_path, "metadata.yml")
+    metadata = {}
+    if os.path.isfile(metadata_path):
+        with open(metadata_path, "r", encoding="utf-8") as metadata_file:
+            metadata = yaml.safe_load(metadata_file) or {}
+    # leave objects that aren't OCRed with tesseract for create_hocr to skip
+    tool = metadata.get("automated_text_tool")
+    if tool is not None and str(tool).strip().lower() != "tesseract":
+        return False
+
+    pages = []
+    for access_file in sorted(access_files, key=lambda path: os.path.basename(path)):
+        access_file = str(access_file)
+        if not access_file.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        sidecar = os.path.join(metadataDir, SIDECAR_DIR, os.path.splitext(os.path.relpath(access_file, derivatives))[0])
+        if not os.path.isfile(sidecar + ".hocr") or not os.path.isfile(sidecar + ".txt"):
+            return False
+        image = os.path.join(object_path, os.path.splitext(access_file)[1][1:].lower(), os.path.basename(access_file))
+        pages.append((image, sidecar))
+    if not pages:
+        return False
+
+    ocr_dir = os.path.join(object_path, "hocr")
+    txt_dir = os.path.join(object_path, "txt")
+    os.makedirs(ocr_dir, exist_ok=True)
+    os.makedirs(txt_dir, exist_ok=True)
+    with open(os.path.join(object_path, "content.txt"), "w", encoding="utf-8") as content_file:
+        for image, sidecar in pages:
+            base_filename = os.path.splitext(os.path.basename(image))[0]
+            with Image.open(image) as img:
+                width, height = img.size
+            with open(sidecar + ".hocr", "r", encoding="utf-8") as f:
+                hocr = scale_hocr(f.read(), width, height)
+            with open(os.path.join(ocr_dir, base_filename + ".hocr"), "w", encoding="utf-8") as f:
+                f.write(hocr)
+            with open(sidecar + ".txt", "r", encoding="utf-8") as f:
+                text = f.read()
+            with open(os.path.join(txt_dir, base_filename + ".txt"), "w", encoding="utf-8") as f:
+                f.write(text)
+            content_file.write(text)
+            content_file.write("\n")
+
+    if os.path.isfile(metadata_path):
+        metadata["automated_text_tool"] = "tesseract"
+        with open(metadata_path, "w", encoding="utf-8") as metadata_file:
+            yaml.safe_dump(metadata, metadata_file, sort_keys=False)
+    return True
@@ -5,8 +5,10 @@ import shutil
 import argparse
 import traceback
 from datetime import datetime
+from stage_timing import stage
 from packages.AIP import ArchivalInformationPackage
 from packages.SIP import SubmissionInformationPackage
+from packages.common import payload_stats
 
 argParse = argparse.ArgumentParser()
 argParse.add_argument("package", help="Package ID in Processing directory.")
@@ -70,70 +72,88 @@ SIP = SubmissionInformationPackage()
 SIP.load(sipPackage)
 
 print ("Validating SIP " + args.package + "...")
-if not SIP.bag.is_valid():
-    raise Exception("ERROR: SIP " + args.package + " is not a valid bag!.")
+with stage("validate SIP", package=args.package, **payload_stats(SIP.bag)):
+    if not SIP.bag.is_valid():
+        raise Exception("ERROR: SIP " + args.package + " is not a valid bag!.")
 print("Finished Validating at " + str(datetime.now()))
 
 print ("Creating AIP " + args.package + "...")
-AIP = ArchivalInformationPackage()
-AIP.create(colID, args.package)
+with stage("create AIP", package=args.package):
+    AIP = ArchivalInformationPackage()
+    AIP.create(colID, args.package)
 
 print ("Moving metadata...")
-AIP.packageMetadata(metadata)
-AIP.addSIPData(SIP.bag.path)
+with stage("package metadata"):
+    AIP.packageMetadata(metadata)
+    AIP.addSIPData(SIP.bag.path)
 
 if not args.noderivatives:
     print ("Moving derivatives...")
-    AIP.packageFiles("derivatives", derivatives)
+    with stage("rsync derivatives", source=derivatives):
+        AIP.packageFiles("derivatives", derivatives)
 
 if args.update:
     print ("Moving masters from processing...")
-    AIP.packageFiles("masters", masters)
+    with stage("rsync masters", source=masters):
+        AIP.packageFiles("masters", masters)
 else:
     print ("Moving masters from SIP...")
-    AIP.packageFiles("masters", SIP.data)
+    with stage("rsync masters", source=SIP.data):
+        AIP.packageFiles("masters", SIP.data)
 
 print ("Cleaning AIP...")    
-AIP.clean()
+with stage("clean AIP"):
+    AIP.clean()
 
 print ("Including logs before saving...")
-logsDest = os.path.join(AIP.bag.path, "logs")
-os.mkdir(logsDest)
-for log in os.listdir(logDir):
-    logMatch = False
-    if args.package in log:
-        logMatch = True
-    elif colID in log:
-        with open(os.path.join(logDir, log), "r") as f:
-            if args.package in f.read():
-                logMatch = True
-    if logMatch:
-        shutil.copy2(os.path.join(logDir, log), logsDest)
+with stage("copy logs") as timing:
+    logsDest = os.path.join(AIP.bag.path, "logs")
+    os.mkdir(logsDest)
+    timing["files"] = 0
+    for log in os.listdir(logDir):
+        logMatch = False
+        if args.package in log:
+            logMatch = True
+        elif colID in log:
+            with open(os.path.join(logDir, log), "r") as f:
+                if args.package in f.read():
+                    logMatch = True
+        if logMatch:
+            shutil.copy2(os.path.join(logDir, log), logsDest)
+            timing["files"] += 1
 
 print ("Writing checksums...")
-AIP.bag.save(processes=4, manifests=True)
+with stage("bag.save", processes=4) as timing:
+    AIP.bag.save(processes=4, manifests=True)
+    timing.update(payload_stats(AIP.bag))
 print ("AIP Saved!")
 print ("Finished save at " + str(datetime.now()))
 
 print ("Staging AIP...")
-AIP.stage()
+with stage("stage", **payload_stats(AIP.bag)):
+    AIP.stage()
 print ("Finished staging at " + str(datetime.now()))
 
 if not args.update:
     print ("Checking AIP against SIP manifest...")
-    if AIP.checkSIPManifest:
+    with stage("checkSIPManifest", package=args.package) as timing:
+        conforms = bool(AIP.checkSIPManifest)
+        timing["conforms"] = conforms
+    if conforms:
         print ("AIP masters conforms to SIP manifest :)")
         print ("Safely removing SIP " + args.package + "...")
-        SIP.safeRemove()
-        sipParent = os.path.join(sipDir, colID)
-        if len(os.listdir(sipParent)) == 0:
-            os.rmdir(sipParent)
+        with stage("remove SIP"):
+            SIP.safeRemove()
+            sipParent = os.path.join(sipDir, colID)
+            if len(os.listdir(sipParent)) == 0:
+                os.rmdir(sipParent)
         print ("Removed SIP " + args.package)
         print ("Removed SIP at " + str(datetime.now()))
         
         # remove processing package
         print (f"Removing processing package {args.package}...")
-        safe_rmtree(package)
+        with stage("remove processing package"):
+            safe_rmtree(package)
         print (f"Removed processing package at {datetime.now()}.")
         collectionDir = os.path.join(processingDir, colID)
         if len(os.listdir(collectionDir)) == 0:
@@ -159,7 +179,8 @@ else:
     if AIP.bag.is_valid():
         # remove processing package
         print ("Removing processing package " + args.package  + "...")
-        safe_rmtree(package)
+        with stage("remove processing package"):
+            safe_rmtree(package)
         collectionDir = os.path.join(processingDir, colID)
         if len(os.listdir(collectionDir)) == 0:
             os.rmdir(collectionDir)
@@ -5,6 +5,8 @@ import bagit
 import shutil
 from datetime import datetime
 from subprocess import Popen, PIPE
+from stage_timing import stage
+from .common import rsync_stats
 
 class ArchivalInformationPackage:
 
@@ -95,11 +97,14 @@ class ArchivalInformationPackage:
     def copyRsync(self, source, destination, retry=0):
         retry += 1
         if retry < 6:
-            cmd = ["rsync", "-arv", "--partial", source, destination]
+            cmd = ["rsync", "-arv", "--partial", "--stats", source, destination]
             print ("Copy attempt " + str(retry) + " at " + str(datetime.now()))
             print ("Running " + " ".join(cmd))
-            p = Popen(cmd, stdout=PIPE, stderr=PIPE)
-            stdout, stderr = p.communicate()
+            with stage("rsync", source=source, destination=destination, attempt=retry) as timing:
+                p = Popen(cmd, stdout=PIPE, stderr=PIPE)
+                stdout, stderr = p.communicate()
+                timing["returncode"] = p.returncode
+                timing.update(rsync_stats(stdout.decode(errors="replace")))
             if p.returncode != 0:
                 print (stdout.decode())
                 print (stderr.decode())
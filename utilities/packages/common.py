@@ -1,16 +1,40 @@
+import re
 from datetime import datetime
 from subprocess import Popen, PIPE
+from stage_timing import stage
+
+def rsync_stats(stdout):
+    """Bytes and regular files transferred, from rsync --stats output."""
+    stats = {}
+    size = re.search(r"Total transferred file size: ([\d,]+)", stdout)
+    if size:
+        stats["bytes"] = int(size.group(1).replace(",", ""))
+    files = re.search(r"Number of (?:regular )?files transferred: ([\d,]+)", stdout)
+    if files:
+        stats["files"] = int(files.group(1).replace(",", ""))
+    return stats
+
+def payload_stats(bag):
+    """Payload bytes and file count from a bag's Payload-Oxum."""
+    try:
+        size, files = bag.info["Payload-Oxum"].split(".")
+        return {"bytes": int(size), "files": int(files)}
+    except (KeyError, ValueError):
+        return {}
 
 class Package:
 
     def copyRsync(self, source, destination, retry=0):
         retry += 1
         if retry < 6:
-            cmd = ["rsync", "-arv", "--partial", source, destination]
+            cmd = ["rsync", "-arv", "--partial", "--stats", source, destination]
             print ("Copy attempt " + str(retry) + " at " + str(datetime.now()))
             print ("Running " + " ".join(cmd))
-            p = Popen(cmd, stdout=PIPE, stderr=PIPE)
-            stdout, stderr = p.communicate()
+            with stage("rsync", source=source, destination=destination, attempt=retry) as timing:
+                p = Popen(cmd, stdout=PIPE, stderr=PIPE)
+                stdout, stderr = p.communicate()
+                timing["returncode"] = p.returncode
+                timing.update(rsync_stats(stdout.decode(errors="replace")))
             if p.returncode != 0:
                 print (stdout.decode())
                 print (stderr.decode())
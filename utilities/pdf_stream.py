@@ -0,0 +1,162 @@
+import os
+from pypdf import PdfReader
+from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject, PdfObject, StreamObject
+
+# Attributes a page can inherit from its parent in the page tree
+INHERITABLE = ("/Resources", "/MediaBox", "/CropBox", "/Rotate")
+
+def resolve(obj):
+    return obj.get_object() if obj is not None else None
+
+def inherited(page, key):
+    """A page attribute, resolved, from the page or the nearest node above it in the page tree."""
+    node = resolve(page)
+    while node is not None:
+        if key in node:
+            return resolve(node.raw_get(key))
+        node = resolve(node.get("/Parent"))
+    return None
+
+class OutputRef(PdfObject):
+    """A reference to an object number in the output, which isn't renumbered like references from a source."""
+
+    def __init__(self, idnum):
+        self.idnum = idnum
+
+    def write_to_stream(self, stream):
+        stream.write(f"{self.idnum} 0 R".encode())
+
+class StreamingPdfWriter:
+    """Writes pages to a PDF as they are added, instead of holding the whole document like PdfWriter.
+
+    Each page is copied from its source PDF with the objects it uses and written straight to
+    the output, and the source is closed before the next one is read. Only the byte offset of
+    each object is kept, so memory stays flat no matter how many pages there are. The page
+    tree, cross-reference table and trailer are written by close().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.stream = open(path, "wb")
+        self.stream.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+        self.offsets = {}
+        self.pages = []
+        # the catalog and page tree are written last, but keep the first object numbers
+        self.catalog_id = self.reserve()
+        self.pages_id = self.reserve()
+
+    def reserve(self):
+        idnum = len(self.offsets) + 1
+        self.offsets[idnum] = None
+        return idnum
+
+    def append(self, source):
+        """Add every page of a PDF, from a path or a file object. Returns the number of pages added."""
+        if isinstance(source, (str, bytes, os.PathLike)):
+            with open(source, "rb") as f:
+                return self.append(f)
+        reader = PdfReader(source)
+        # objects the source's pages share, like fonts, are only written once
+        ids = {}
+        for page in reader.pages:
+            self.add_page(page, ids)
+        return len(reader.pages)
+
+    def add_page(self, page, ids=None):
+        if ids is None:
+            ids = {}
+        source_ref = page.indirect_reference
+        page_id = self.reserve()
+        if source_ref is not None:
+            ids[(source_ref.idnum, source_ref.generation)] = page_id
+        parent = page.raw_get("/Parent") if "/Parent" in page else None
+        if isinstance(parent, IndirectObject):
+            # anything pointing at the source page tree gets ours instead
+            ids[(parent.idnum, parent.generation)] = self.pages_id
+
+        page_dict = DictionaryObject()
+        for key, value in page.items():
+            if key != "/Parent":
+                page_dict[NameObject(key)] = value
+        node = page
+        while "/Parent" in node:
+            node = node["/Parent"].get_object()
+            for key in INHERITABLE:
+                if key in node and not key in page_dict:
+                    page_dict[NameObject(key)] = node.raw_get(key)
+        page_dict[NameObject("/Parent")] = OutputRef(self.pages_id)
+
+        queue = []
+        self.write_object(page_id, page_dict, ids, queue)
+        while queue:
+            ref = queue.pop()
+            self.write_object(ids[(ref.idnum, ref.generation)], ref.get_object(), ids, queue)
+        self.pages.append(page_id)
+
+    def write_object(self, idnum, obj, ids, queue):
+        self.offsets[idnum] = self.stream.tell()
+        self.stream.write(f"{idnum} 0 obj\n".encode())
+        self.write_value(obj, ids, queue)
+        self.stream.write(b"\nendobj\n")
+
+    def write_value(self, value, ids, queue):
+        """Serialize a value, renumbering indirect references and queueing the objects they point to."""
+        stream = self.stream
+        if isinstance(value, IndirectObject):
+            key = (value.idnum, value.generation)
+            if not key in ids:
+                ids[key] = self.reserve()
+                queue.append(value)
+            stream.write(f"{ids[key]} 0 R".encode())
+        elif isinstance(value, DictionaryObject):
+            stream.write(b"<<\n")
+            for key, item in value.items():
+                if isinstance(value, StreamObject) and key == "/Length":
+                    continue
+                NameObject(key).write_to_stream(stream)
+                stream.write(b" ")
+                self.write_value(item, ids, queue)
+                stream.write(b"\n")
+            if isinstance(value, StreamObject):
+                stream.write(f"/Length {len(value._data)}\n".encode())
+            stream.write(b">>")
+            if isinstance(value, StreamObject):
+                stream.write(b"\nstream\n")
+                stream.write(value._data)
+                stream.write(b"\nendstream")
+        elif isinstance(value, ArrayObject):
+            stream.write(b"[")
+            for item in value:
+                stream.write(b" ")
+                self.write_value(item, ids, queue)
+            stream.write(b" ]")
+        elif value is None:
+            stream.write(b"null")
+        else:
+            value.write_to_stream(stream)
+
+    def close(self):
+        stream = self.stream
+        kids = " ".join(f"{page_id} 0 R" for page_id in self.pages)
+        self.offsets[self.pages_id] = stream.tell()
+        stream.write(f"{self.pages_id} 0 obj\n<< /Type /Pages /Count {len(self.pages)} /Kids [ {kids} ] >>\nendobj\n".encode())
+        self.offsets[self.catalog_id] = stream.tell()
+        stream.write(f"{self.catalog_id} 0 obj\n<< /Type /Catalog /Pages {self.pages_id} 0 R >>\nendobj\n".encode())
+
+        xref = stream.tell()
+        stream.write(f"xref\n0 {len(self.offsets) + 1}\n".encode())
+        stream.write(b"0000000000 65535 f \n")
+        for idnum in range(1, len(self.offsets) + 1):
+            stream.write(f"{self.offsets[idnum]:010d} 00000 n \n".encode())
+        stream.write(f"trailer\n<< /Size {len(self.offsets) + 1} /Root {self.catalog_id} 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+        stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.stream.close()
+        return False
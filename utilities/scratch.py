@@ -0,0 +1,134 @@
+import os
+import time
+import shutil
+from contextlib import contextmanager
+
+# Local or RAM backed directory (e.g. /dev/shm or a local SSD) for temporary files, so they don't
+# cross the /backlog share. Unset, jobs use a temporary folder in the package like before.
+SCRATCH_DIR = os.getenv("PROCESSING_SCRATCH_DIR")
+SCRATCH_MIN_FREE = int(os.getenv("PROCESSING_SCRATCH_MIN_FREE_MB", "512")) * 1024 * 1024
+# Folders left by jobs that are no longer running are kept this long so a rerun can resume from them
+ORPHAN_HOURS = float(os.getenv("PROCESSING_SCRATCH_ORPHAN_HOURS", "24"))
+OWNER_SUFFIX = ".owner"
+BOOT_ID = "/proc/sys/kernel/random/boot_id"
+
+def pid_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def boot_id():
+    try:
+        with open(BOOT_ID, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def process_start(pid):
+    """When a process started, in clock ticks since boot, or None where there's no /proc."""
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # starttime is the 22nd field, counting from the state after the command name, which can have spaces
+    return int(stat.rsplit(")", 1)[1].split()[19])
+
+def owner_record(pid):
+    """What's written to an owner file: the pid, and the boot and start time that tell it apart from a later process with the same pid."""
+    return f"{pid} {boot_id() or '-'} {process_start(pid) or '-'}"
+
+def read_owner(owner_file):
+    """The pid, boot ID and start time in an owner file, with None for any it doesn't have."""
+    try:
+        with open(owner_file, "r") as f:
+            fields = f.read().split()
+        pid = int(fields[0]) if fields else None
+    except (OSError, ValueError):
+        return None, None, None
+    boot, start = (fields[1:3] + ["-", "-"])[:2]
+    return pid, None if boot == "-" else boot, None if start == "-" else int(start)
+
+def owner_alive(owner):
+    """Whether the process that wrote an owner record is still running. After a restart its pid
+    can belong to something else, so the boot and start time have to match too where they're known."""
+    pid, boot, start = owner
+    if not pid_alive(pid):
+        return False
+    if boot is not None and boot != boot_id():
+        return False
+    return start is None or process_start(pid) == start
+
+def has_room(path, needed=0, min_free=None):
+    """Whether a filesystem has space for a job's temporary files and the reserve on top."""
+    if min_free is None:
+        min_free = SCRATCH_MIN_FREE
+    return shutil.disk_usage(path).free >= needed + min_free
+
+def clean_orphans(root=None, max_age=None):
+    """Remove job folders whose owner has exited and that haven't been touched in max_age seconds."""
+    root = root or SCRATCH_DIR
+    if max_age is None:
+        max_age = ORPHAN_HOURS * 3600
+    removed = []
+    for entry in os.scandir(root):
+        if not entry.is_dir(follow_symlinks=False):
+            continue
+        owner_file = entry.path + OWNER_SUFFIX
+        if owner_alive(read_owner(owner_file)):
+            continue
+        if time.time() - entry.stat().st_mtime < max_age:
+            continue
+        shutil.rmtree(entry.path, ignore_errors=True)
+        if os.path.isfile(owner_file):
+            os.remove(owner_file)
+        removed.append(entry.name)
+    return removed
+
+def claim(path):
+    """Mark a job folder as owned by this process, refusing one another running job owns."""
+    owner_file = path + OWNER_SUFFIX
+    owner = read_owner(owner_file)
+    if owner[0] and owner[0] != os.getpid() and owner_alive(owner):
+        raise RuntimeError(f"ERROR: scratch directory {path} is in use by process {owner[0]}.")
+    os.makedirs(path, exist_ok=True)
+    with open(owner_file, "w") as f:
+        f.write(owner_record(os.getpid()))
+
+@contextmanager
+def scratch_dir(name, fallback, needed=0):
+    """Yield a private folder for a job's temporary files.
+
+    This is SCRATCH_DIR/name if a scratch directory is set and has room for needed bytes,
+    otherwise the fallback folder in the package. A scratch folder is removed when the job
+    finishes, but kept if it fails, so a rerun with the same name can pick up its files.
+    """
+    path = None
+    if SCRATCH_DIR:
+        try:
+            os.makedirs(SCRATCH_DIR, exist_ok=True)
+            removed = clean_orphans(SCRATCH_DIR)
+            if removed:
+                print (f"Removed {len(removed)} orphaned scratch directories: {', '.join(removed)}")
+            if has_room(SCRATCH_DIR, needed):
+                path = os.path.join(SCRATCH_DIR, name)
+            else:
+                print (f"WARNING: {SCRATCH_DIR} has less than {(needed + SCRATCH_MIN_FREE) // (1024 * 1024)} MB free, using {fallback} instead.")
+        except OSError as e:
+            print (f"WARNING: scratch directory {SCRATCH_DIR} unavailable, using {fallback} instead. {e}")
+
+    if path is None:
+        os.makedirs(fallback, exist_ok=True)
+        yield fallback
+        return
+
+    claim(path)
+    yield path
+    shutil.rmtree(path, ignore_errors=True)
+    os.remove(path + OWNER_SUFFIX)
@@ -0,0 +1,98 @@
+import os
+import sys
+import json
+import time
+from datetime import datetime
+from contextlib import contextmanager
+
+# jobs.py sets this to the job's log, and events go to a sidecar next to it
+LOG_FILE_ENV = "PROCESSING_LOG_FILE"
+TIMING_SUFFIX = ".timing.jsonl"
+
+_warned = False
+
+def sidecar_path(log_file=None):
+    """Path of the timing sidecar for a job log, or None when not running as a job."""
+    log_file = log_file or os.getenv(LOG_FILE_ENV)
+    if not log_file:
+        return None
+    return os.path.splitext(log_file)[0] + TIMING_SUFFIX
+
+def record(event, name, **fields):
+    """Append one JSON event to the timing sidecar."""
+    global _warned
+    path = sidecar_path()
+    if path is None:
+        return
+    line = json.dumps({
+        "time": datetime.now().isoformat(timespec="milliseconds"),
+        "event": event,
+        "stage": name,
+        "pid": os.getpid(),
+        **fields,
+    }, default=str)
+    try:
+        # One short append per event, so worker processes can share the file
+        with open(path, "a") as f:
+            f.write(line + "\n")
+    except OSError as e:
+        if not _warned:
+            print(f"WARNING: Could not write stage timing to {path}, {e}")
+            _warned = True
+
+@contextmanager
+def stage(name, **fields):
+    """Time a block of work, recording start and end events for it.
+
+    Yields a dict the block can add results to, like bytes, files or returncode,
+    which are included in the end event along with the duration in seconds.
+    """
+    info = dict(fields)
+    record("start", name, **fields)
+    started = time.perf_counter()
+    try:
+        yield info
+    except BaseException as e:
+        info["error"] = repr(e)
+        raise
+    finally:
+        info["seconds"] = round(time.perf_counter() - started, 3)
+        record("end", name, **info)
+
+def summarize(path):
+    """Total time, count, bytes and files by stage from a timing sidecar."""
+    totals = {}
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            if event.get("event") != "end":
+                continue
+            total = totals.setdefault(event["stage"], {"count": 0, "seconds": 0.0, "bytes": 0, "files": 0, "failed": 0})
+            total["count"] += 1
+            total["seconds"] += event.get("seconds", 0)
+            total["bytes"] += event.get("bytes") or 0
+            total["files"] += event.get("files") or 0
+            if event.get("error") or event.get("returncode", 0) != 0:
+                total["failed"] += 1
+    return totals
+
+
+# for summarizing a sidecar with command line args
+if __name__ == "__main__":
+    import argparse
+
+    argParse = argparse.ArgumentParser(description="Summarize where a job spent its time.")
+    argParse.add_argument("path", help="A job's .log or .timing.jsonl file.")
+    args = argParse.parse_args()
+
+    path = args.path if args.path.endswith(TIMING_SUFFIX) else sidecar_path(args.path)
+    totals = summarize(path)
+    if not totals:
+        print(f"No stages recorded in {path}")
+        sys.exit(1)
+    print(f"{'stage':<30} {'count':>7} {'seconds':>10} {'MB':>10} {'files':>8} {'failed':>7}")
+    for name, total in sorted(totals.items(), key=lambda item: item[1]["seconds"], reverse=True):
+        print(f"{name:<30} {total['count']:>7} {total['seconds']:>10.1f} {total['bytes'] / 1048576:>10.1f} {total['files']:>8} {total['failed']:>7}")
@@ -9,11 +9,13 @@ import argparse
 
 from zoneinfo import ZoneInfo
 from bs4 import BeautifulSoup
-import asnake.logging as logging
-from asnake.client import ASnakeClient
 from datetime import datetime, timezone
 from pathlib import Path, PureWindowsPath, PurePosixPath
 from id_normalization import normalize_collection_id
+from aspace_cache import cached_get, invalidate
+from aspace_client import get_client
+from stage_timing import stage
+from ocr_sidecars import import_sidecars
 
 def main():
     parser = argparse.ArgumentParser(description="Process digital object upload arguments.")
@@ -87,14 +89,14 @@ def main():
     client = None
 
     if not skip_aspace:
-        logging.setup_logging(filename="/logs/aspace-flask.log", filemode="a", level="INFO")
-        client = ASnakeClient()
+        client = get_client()
 
-        ref = client.get("repositories/2/find_by_id/archival_objects?ref_id[]=" + args.refID).json()
+        # The validator usually just made these lookups. The item itself isn't cached since it's updated below.
+        ref = cached_get(client, "repositories/2/find_by_id/archival_objects?ref_id[]=" + args.refID, tag=args.refID).json()
         item = client.get(ref["archival_objects"][0]["ref"]).json()
 
         resourceURI = item["resource"]["ref"]
-        resource = client.get(resourceURI).json()
+        resource = cached_get(client, resourceURI, tag=args.refID).json()
 
         aspace_collection_id = normalize_collection_id(resource["id_0"])
         if aspace_collection_id != package_collection_id:
@@ -226,43 +228,57 @@ def main():
             raise FileNotFoundError(f"ERROR: no {input_format_lower} files found in package {args.packageID} masters or derivatives.")
 
     # Move access files to SPE_DAO
-    for access_file in file_list:
-        ext = os.path.splitext(access_file)[1][1:].lower()
-        format_path = os.path.join(object_path, ext)
-        if not os.path.isdir(format_path):
-            os.mkdir(format_path)
-        shutil.copy(access_file, format_path)
+    with stage("copy access files", destination=object_path, files=len(file_list)) as timing:
+        timing["bytes"] = 0
+        for access_file in file_list:
+            ext = os.path.splitext(access_file)[1][1:].lower()
+            format_path = os.path.join(object_path, ext)
+            if not os.path.isdir(format_path):
+                os.mkdir(format_path)
+            shutil.copy(access_file, format_path)
+            timing["bytes"] += os.path.getsize(access_file)
 
     # make thumbnail
     print ("Creating thumbnail")
-    iiiflow.make_thumbnail(collection_ID, args.refID)
+    with stage("thumbnail"):
+        iiiflow.make_thumbnail(collection_ID, args.refID)
 
     pdf_formats = ["png", "jpg"]
     if not args.input_format.lower() in av_formats:
         if args.PDF.lower() == "true" and args.input_format.lower() in pdf_formats:
             print ("Creating alternative PDF...")
-            iiiflow.create_pdf(collection_ID, args.refID)
+            with stage("alternative PDF"):
+                iiiflow.create_pdf(collection_ID, args.refID)
 
     # Create pyramidal tifs
     print ("Creating pyramidal tifs (.ptifs)...")
-    iiiflow.create_ptif(collection_ID, args.refID)
+    with stage("ptif"):
+        iiiflow.create_ptif(collection_ID, args.refID)
 
     if not args.input_format.lower() in av_formats:
-        # OCR
-        print ("Recognizing text...")
-        iiiflow.create_hocr(collection_ID, args.refID)
+        # OCR, unless ocr.py --single-pass already left hOCR for every image
+        with stage("hOCR") as timing:
+            timing["reused"] = import_sidecars(object_path, os.path.join(package_path, "derivatives"), metadata, file_list)
+            if timing["reused"]:
+                print ("Using hOCR and text from the package's OCR run...")
+            else:
+                print ("Recognizing text...")
+                iiiflow.create_hocr(collection_ID, args.refID)
 
         # Index HOCR
         print ("Indexing text for content search...")
-        iiiflow.index_hocr_to_solr(collection_ID, args.refID)
+        with stage("index hOCR"):
+            iiiflow.index_hocr_to_solr(collection_ID, args.refID)
     else:
         # Create AV transcription
         print ("Transcribing...")
-        iiiflow.create_transcription(collection_ID, args.refID)
+        with stage("transcription"):
+            iiiflow.create_transcription(collection_ID, args.refID)
 
     # Create manifest
     print ("Generating IIIF manifest...")
-    iiiflow.create_manifest(collection_ID, args.refID)
+    with stage("manifest"):
+        iiiflow.create_manifest(collection_ID, args.refID)
 
     if skip_aspace:
         print("Skipping ArchivesSpace digital object creation for external ref_id workflow.")
@@ -360,6 +376,7 @@ def main():
         print (f"Added processing note.")
 
     update_item = client.post(item["uri"], json=item)
+    invalidate(args.refID)
     if update_item.status_code == 200:
         print (f"Updated archival object record --> {update_item.status_code}")
     else:
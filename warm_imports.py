@@ -0,0 +1,13 @@
+import importlib
+
+# Imported once by the job runner's forkserver so each utility job starts with these loaded
+MODULES = [
+    "iiiflow", "asnake.client", "asnake.logging", "openpyxl", "pypdf", "PIL.Image",
+    "bs4", "yaml", "bagit", "img2pdf", "shortuuid", "description_harvester",
+]
+
+for name in MODULES:
+    try:
+        importlib.import_module(name)
+    except Exception as e:
+        print(f"Could not preload {name}: {e!r}")